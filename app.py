@@ -16,12 +16,16 @@ from flask_admin import Admin
 from flask_admin.contrib.sqla import ModelView
 from flask_admin.menu import MenuLink
 from db_setup import db, Base, init_db_and_models
+from socket_emitter import CoalescingEmitter
+from redis_setup import get_redis_client
 
 # Get the absolute path of the project's root directory (where app.py is located)
 _basedir = os.path.abspath(os.path.dirname(__file__))
 
 # Socket initialization
 socketio = SocketIO(message_queue=Config.CELERY_BROKER_URL)
+# Status broadcasts go through this so bursts reach clients as one batched frame
+emitter = CoalescingEmitter(socketio, Config.SOCKETIO_COALESCE_WINDOW_MS)
 
 class SocketIOHandler(logging.Handler):
     def emit(self, record):
@@ -66,6 +70,12 @@ def create_app(config_class=Config):
     
     # init database and autodiscover models
     init_db_and_models(app)
+    from blueprints.tasks.archive import ensure_archive_table
+    with app.app_context():
+        try:
+            ensure_archive_table()
+        except Exception as e:
+            print(f"Warning: Could not create the task archive table. {e}")
     admin = Admin(
         app,
         name='Database Viewer',
@@ -103,6 +113,10 @@ def create_app(config_class=Config):
     # Register blueprints
     register_blueprints(app)
 
+    # Compile the workflow definitions once, for O(1) step lookups in the webhooks
+    from blueprints.workflow.definitions import compile_workflows
+    app.workflow_index = compile_workflows(app.config['WORKFLOWS'])
+
 
     # --- Setup Logging for the Flask App ---
     socket_handler = SocketIOHandler()
@@ -117,14 +131,16 @@ def create_app(config_class=Config):
     # Initialize Redis connection directly in the app factory.
     # This replaces the deprecated `@app.before_first_request`.
     try:
-        app.redis_conn = redis.StrictRedis(
-            host=app.config['REDIS_HOST'],
-            port=app.config['REDIS_PORT'],
-            db=app.config['REDIS_DB'],
-            decode_responses=True
-        )
+        # Every request, task and worker of this process shares one connection pool
+        app.redis_conn = get_redis_client(app.config)
         app.redis_conn.ping()
         print("Redis connection successful!")
+
+        from blueprints.tasks.utils import migrate_legacy_task_list
+        from blueprints.summary.utils import migrate_legacy_summary_history
+        migrate_legacy_task_list(app.redis_conn)
+        with app.app_context():
+            migrate_legacy_summary_history(app.redis_conn)
     except redis.ConnectionError as e:
         print(f"Warning: Redis connection failed. {e}")
         app.redis_conn = None
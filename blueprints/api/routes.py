@@ -1,15 +1,26 @@
 # blueprints/api/routes.py
+import re
 import uuid
-import json
+import hashlib
 from datetime import datetime
 from dateutil import tz
 import requests
 import redis
 import os
 from flask import Blueprint, jsonify, request, current_app
-from .utils import update_app_status_via_api, get_current_app_status
-from ..tasks.utils import get_all_tasks, remove_task_from_list, store_task_info
+from .utils import (
+    update_app_status_via_api, get_current_app_status, get_status_history, get_status_version, conditional_json,
+    delivery_id, claim_deliveries, release_deliveries,
+)
+from ..tasks.utils import (
+    get_all_tasks, get_tasks_page, get_tasks_version, delete_task, transition_task, store_task_info,
+    INDEXED_TASK_FIELDS,
+)
+from ..tasks.archive import delete_archived_task, get_archived_task
+from ..summary.utils import unwrap_summary_part, merge_summary_result, report_object_key
+from ..summary.task import prepare_report
 from celery_app import celery
+from redis_setup import get_redis_pool_stats
 from celery.contrib.abortable import AbortableAsyncResult
 
 api_bp = Blueprint('api', __name__)
@@ -32,8 +43,7 @@ def predict_stok():
         error_msg = 'The WORKFLOW_2 environment variable is not set in the backend.'
         print(f"ERROR: {error_msg}")
         if task_id and redis_conn:
-            redis_conn.hset(f"task:{task_id}", "status", "FAILURE")
-            redis_conn.hset(f"task:{task_id}", "last_message", error_msg)
+            transition_task(task_id, "FAILURE", error_msg)
         return jsonify({"error": error_msg}), 500
 
     try:
@@ -58,8 +68,7 @@ def predict_stok():
         error_msg = f"Gagal mengirim request ke layanan prediksi: {e}"
         print(f"ERROR: {error_msg}")
         if task_id and redis_conn:
-            redis_conn.hset(f"task:{task_id}", "status", "FAILURE")
-            redis_conn.hset(f"task:{task_id}", "last_message", error_msg)
+            transition_task(task_id, "FAILURE", error_msg)
         return jsonify({"error": str(e)}), 502
 
 @api_bp.route('/status', methods=['GET', 'POST'])
@@ -75,16 +84,79 @@ def status_endpoint():
         update_app_status_via_api(data.get('status')) 
         return jsonify({"message": "Status berhasil diperbarui"}), 200
     else:
-        # GET reads the current status from Redis
-        current_status = get_current_app_status() 
-        return jsonify(current_status)
+        # GET reads the current status from Redis, unless the client's copy is still current
+        version = get_status_version()
+        etag = f"status-{version}" if version is not None else None
+        return conditional_json(etag, get_current_app_status)
+
+@api_bp.route('/status/history', methods=['GET'])
+def status_history():
+    """
+    Global status updates, oldest first: {"entries": [...], "last_id": <id|null>}.
+
+    `?since=<id>` returns only the updates after that stream ID, so a client
+    that saw update <id> can catch up after a reconnect. `?limit=` caps the
+    number of entries (1-1000, default 100); a full page means there may be
+    more, fetched by passing the returned last_id as the next `since`.
+    """
+    since = request.args.get('since') or None
+    limit = request.args.get('limit', default=100, type=int)
+    if limit is None or not 1 <= limit <= 1000:
+        return jsonify({"error": "'limit' must be an integer between 1 and 1000"}), 400
+    if since and not re.fullmatch(r'\d+(-\d+)?', since):
+        return jsonify({"error": "'since' must be a status history ID"}), 400
+
+    try:
+        entries = get_status_history(since=since, limit=limit)
+    except redis.exceptions.ResponseError as e:
+        return jsonify({"error": f"Invalid 'since': {e}"}), 400
+    last_id = entries[-1]['id'] if entries else since
+    return jsonify({"entries": entries, "last_id": last_id})
+
+
+@api_bp.route('/redis/pool', methods=['GET'])
+def redis_pool_stats():
+    """Connections created, in use and idle in this process's shared Redis pools."""
+    return jsonify(get_redis_pool_stats())
 
 # --- TASK MANAGEMENT API ---
 @api_bp.route('/tasks', methods=['GET'])
 def get_tasks_api():
-    from ..tasks.utils import get_all_tasks
-    tasks = get_all_tasks()
-    return jsonify(tasks)
+    """
+    Lists tasks, newest first.
+
+    `?status=` and `?workflow_type=` filter the list using the task indexes.
+    Without `limit`/`before` the whole (filtered) list of tasks still in Redis
+    is returned as before. With `?limit=<n>&before=<cursor>` a single page is
+    returned together with the cursor for the next one:
+    {"tasks": [...], "next_before": <cursor|null>}. Pages continue from Redis
+    into the Postgres task archive, so older tasks stay reachable.
+    """
+    filters = {field: request.args.get(field) for field in INDEXED_TASK_FIELDS if request.args.get(field)}
+
+    # The ETag covers both the task-store version and the query, so each
+    # filter/page combination revalidates independently.
+    version = get_tasks_version()
+    etag = None
+    if version is not None:
+        query_hash = hashlib.sha1(request.query_string).hexdigest()[:12]
+        etag = f"tasks-{version}-{query_hash}"
+
+    if 'limit' not in request.args and 'before' not in request.args:
+        return conditional_json(etag, lambda: get_all_tasks(filters=filters))
+
+    limit = request.args.get('limit', default=50, type=int)
+    before = request.args.get('before', type=float)
+    if limit is None or not 1 <= limit <= 500:
+        return jsonify({"error": "'limit' must be an integer between 1 and 500"}), 400
+    if 'before' in request.args and before is None:
+        return jsonify({"error": "'before' must be a cursor returned by a previous page"}), 400
+
+    def build_page():
+        tasks, next_before = get_tasks_page(limit=limit, before=before, filters=filters, include_archive=True)
+        return {"tasks": tasks, "next_before": next_before}
+
+    return conditional_json(etag, build_page)
 
 
 @api_bp.route('/tasks/<task_id>/abort', methods=['POST'])
@@ -104,8 +176,7 @@ def abort_task(task_id):
             redis_conn.set(f"task-aborted:{task_id}", "1", ex=3600)
 
             # Also update the main status for immediate feedback in the UI
-            redis_conn.hset(f"task:{task_id}", "status", "ABORTED")
-            redis_conn.hset(f"task:{task_id}", "last_message", "Abort signal sent by user.")
+            transition_task(task_id, "ABORTED", "Abort signal sent by user.")
 
         print(f"Abort signal and Redis flag set for task {task_id}")
         return jsonify({"message": f"Abort signal sent to task {task_id}"}), 200
@@ -115,13 +186,9 @@ def abort_task(task_id):
 @api_bp.route('/tasks/<task_id>/remove', methods=['DELETE'])
 def remove_task(task_id):
     try:
-        # Remove from active tasks list
-        remove_task_from_list(task_id)
-
-        # Delete task info from Redis
-        redis_conn = current_app.redis_conn
-        if redis_conn:
-            redis_conn.delete(f"task:{task_id}")
+        # Delete task info and its index entries from Redis, and its archived copy if any
+        delete_task(task_id)
+        delete_archived_task(task_id)
 
         return jsonify({"message": f"Task {task_id} telah dihapus dari daftar"}), 200
     except Exception as e:
@@ -143,6 +210,9 @@ def get_task_status(task_id):
         if redis_conn:
             redis_info = redis_conn.hgetall(f"task:{task_id}")
             task_info.update(redis_info)
+        if not task_info.get('task_name'):
+            # Finished tasks move to the archive after a while
+            task_info.update(get_archived_task(task_id) or {})
 
         return jsonify(task_info)
     except Exception as e:
@@ -177,10 +247,8 @@ def update_task_api(task_id):
 
     redis_conn = current_app.redis_conn
     if redis_conn:
-        if status:
-            redis_conn.hset(f"task:{task_id}", "status", status)
-        if last_message:
-            redis_conn.hset(f"task:{task_id}", "last_message", last_message)
+        if status or last_message:
+            transition_task(task_id, status, last_message or None)
         return jsonify({"status": "success"}), 200
     return jsonify({"error": "redis connection failed"}), 500
 
@@ -193,8 +261,9 @@ def save_summary_result():
     to the correct Celery task.
     
     --- MODIFIED TO MERGE JSON DATA ---
-    It now fetches existing data, unwraps the 'json' key, and merges 
-    the new payload, allowing n8n to send data in separate calls.
+    It unwraps the 'json' key and merges the new payload into the stored
+    result atomically (see merge_summary_result), allowing n8n to send data
+    in separate, even concurrent, calls.
     """
     task_id = request.args.get('flask_task_id')
     if not task_id:
@@ -204,87 +273,42 @@ def save_summary_result():
     if not new_data:
         return jsonify({"error": "Invalid JSON payload"}), 400
 
-    try:
-        redis_client = redis.Redis(host=current_app.config['REDIS_HOST'], port=current_app.config['REDIS_PORT'], db=0,
-                                   decode_responses=True)
+    # n8n retries a failed HTTP node with the same payload; merging it again would
+    # only repeat the writes and the status transition
+    dedup_id = delivery_id(request.headers.get('Idempotency-Key'), task_id, new_data)
+    if not claim_deliveries('summary_result', [dedup_id])[0]:
+        print(f"Skipped duplicate summary result delivery for task {task_id}.")
+        return jsonify({"status": "duplicate", "message": f"Result for task {task_id} was already received."}), 200
 
-        # --- START CORRECT MERGE LOGIC ---
-        existing_data_json = redis_client.get(f'summary_result:{task_id}')
-        final_data_item = {} # This will hold the merged dictionary
-        
-        # 1. Load existing data if it exists
-        if existing_data_json:
+    try:
+        if not current_app.redis_conn:
+            raise redis.exceptions.ConnectionError("Redis connection not available")
+
+        # Unwrap the 'json' key n8n nests the payload in and normalise file_id,
+        # then merge it into the stored result, register the task in the
+        # history and advance its status in one atomic server-side write, so
+        # concurrent parts (stats, top_5_understocked) never overwrite each other
+        new_data_item = unwrap_summary_part(new_data)
+        if new_data_item is None:
+            release_deliveries('summary_result', [dedup_id])
+            return jsonify({"error": "Invalid JSON payload"}), 400
+        merged = merge_summary_result(task_id, new_data_item)
+        print(f"Merged {len(new_data_item)} field(s) into the summary for task {task_id} (complete: {merged['complete']}).")
+
+        # Prepare the report in the background so the result page opens without parsing the CSV
+        object_key = report_object_key(new_data_item)
+        if object_key:
             try:
-                existing_data = json.loads(existing_data_json)
-                # Handle both list (e.g., [{}]) and dict (e.g., {}) formats
-                if isinstance(existing_data, list) and existing_data:
-                    final_data_item = existing_data[0] # Get dict from list
-                elif isinstance(existing_data, dict):
-                    final_data_item = existing_data # Use dict directly
-            except json.JSONDecodeError:
-                 print(f"Warning: Corrupted JSON in Redis for {task_id}, will overwrite.")
-                 pass # final_data_item remains {}
-        
-        # 2. Determine what the new data is (list or dict)
-        new_data_item_raw = {}
-        if isinstance(new_data, list) and new_data:
-            new_data_item_raw = new_data[0] # This is {"json": {...}}
-        elif isinstance(new_data, dict):
-            new_data_item_raw = new_data # This might be {"json": {...}} or just {...}
-            
-        # --- THIS IS THE CRUCIAL UNWRAP LOGIC ---
-        # Check if the data is nested inside a 'json' key
-        if 'json' in new_data_item_raw and isinstance(new_data_item_raw['json'], dict):
-            new_data_item = new_data_item_raw['json'] # Get the inner object
-        else:
-            new_data_item = new_data_item_raw # Use the object as-is
-        # --- END UNWRAP LOGIC ---
-            
-        # 3. Merge new data (which is now unwrapped) into existing data
-        final_data_item.update(new_data_item)
-        
-        # 4. Standardize final data to be a list containing one dictionary
-        final_data = [final_data_item]
-        # --- END CORRECT MERGE LOGIC ---
-
-
-        # --- File ID and Date Injection Logic (runs on the merged data) ---
-        if 'file_id' in final_data[0] and not final_data[0]['file_id'].endswith('.csv'):
-             final_data[0]['file_id'] += '.csv' # Add .csv if missing
-             print(f"Appended .csv to file_id for task {task_id}. New file_id: {final_data[0]['file_id']}")
-
-        if 'date' not in final_data[0] or not final_data[0].get('date'):
-            task_info = redis_client.hgetall(f"task:{task_id}")
-            # Try to get prediction_date, fallback to created_at
-            prediction_date = task_info.get('prediction_date') or task_info.get('created_at')
-            if prediction_date:
-                # Try to parse just the date part if it's a full ISO timestamp
-                date_only = prediction_date.split('T')[0]
-                final_data[0]['date'] = date_only
-                print(f"Injected missing date '{date_only}' into summary for task {task_id}")
-        # --- END FIX ---
-
-
-        # Store the MERGED, UNWRAPPED JSON result
-        redis_client.set(f'summary_result:{task_id}', json.dumps(final_data), ex=604800) # Expires in 7 days
-
-        # Only add to history ONCE
-        if not existing_data_json:
-            redis_client.lpush('summary_task_history', task_id)
-
-        # Update the status of the original Celery task
-        # Check if both parts are present (one from stats, one from top_5)
-        if 'total_products' in final_data[0] and 'top_5_understocked' in final_data[0]:
-            redis_client.hset(f"task:{task_id}", "status", "Prediksi Selesai")
-            redis_client.hset(f"task:{task_id}", "last_message", "Analysis complete. Report received from n8n.")
-        else:
-            redis_client.hset(f"task:{task_id}", "status", "Processing")
-            redis_client.hset(f"task:{task_id}", "last_message", "Received partial data from n8n...")
+                prepare_report.delay(object_key)
+            except Exception as e:
+                print(f"Warning: Could not queue report preparation for task {task_id}: {e}")
 
         return jsonify({"status": "success", "message": f"Result for task {task_id} saved/merged."}), 200
     except redis.exceptions.ConnectionError as e:
+        release_deliveries('summary_result', [dedup_id])
         return jsonify({"error": "Could not connect to Redis", "details": str(e)}), 500
     except Exception as e:
+        release_deliveries('summary_result', [dedup_id])
         return jsonify({"error": "An unexpected error occurred", "details": str(e)}), 500
 
 @api_bp.route('/workflow/start', methods=['POST'])
@@ -379,10 +403,7 @@ def start_workflow():
         else:
              update_app_status_via_api(f"❌ Gagal memulai Workflow '{workflow_type}' ({task_id})")
 
-        redis_conn = current_app.redis_conn
-        if redis_conn:
-            redis_conn.hset(f"task:{task_id}", "status", "FAILURE")
-            redis_conn.hset(f"task:{task_id}", "last_message", error_message)
+        transition_task(task_id, "FAILURE", error_message)
         # Return 504 Gateway Timeout specifically for timeout errors
         status_code = 504 if isinstance(e, requests.exceptions.Timeout) else 500
         return jsonify({"error": error_message}), status_code
\ No newline at end of file
@@ -0,0 +1,85 @@
+# blueprints/api/status_cache.py
+import json
+import threading
+import time
+
+GLOBAL_STATUS_CHANNEL = "global_app_status:updates" # update_app_status_via_api publishes every update here
+
+
+class StatusCache:
+    """
+    Per-process copy of the global status and its version.
+
+    A background thread subscribes to GLOBAL_STATUS_CHANNEL; every update
+    published by update_app_status_via_api (in any process) carries the new
+    status and version, so the copy is replaced without reading Redis. Once
+    subscribed, the thread loads the current value once, so nothing published
+    before the subscription is missed. While the subscription is down the
+    cache reports itself empty and callers read Redis directly.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._status = None
+        self._version = None
+        self._thread = None
+
+    def get(self):
+        """(status dict, version) or None when the cache cannot be trusted."""
+        with self._lock:
+            if self._status is None:
+                return None
+            return dict(self._status), self._version
+
+    def start(self, redis_conn, load_current):
+        """
+        Start the subscriber thread once per process. `load_current` reads the
+        (status, version) pair straight from Redis.
+        """
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=self._listen, args=(redis_conn, load_current), name='status-cache', daemon=True
+            )
+            self._thread.start()
+
+    def _set(self, status, version):
+        with self._lock:
+            # Messages and the initial load may race; the highest version wins
+            if self._version is None or int(version) >= int(self._version):
+                self._status, self._version = status, str(version)
+
+    def _invalidate(self):
+        with self._lock:
+            self._status, self._version = None, None
+
+    def _listen(self, redis_conn, load_current):
+        backoff = 1
+        while True:
+            pubsub = redis_conn.pubsub()
+            try:
+                pubsub.subscribe(GLOBAL_STATUS_CHANNEL)
+                while True:
+                    message = pubsub.get_message(timeout=5.0)
+                    if message is None:
+                        continue
+                    if message['type'] == 'subscribe':
+                        self._set(*load_current())
+                        backoff = 1
+                    elif message['type'] == 'message':
+                        update = json.loads(message['data'])
+                        self._set(update['status'], update['version'])
+            except Exception as e:
+                print(f"Warning: Global status cache lost its subscription, reading Redis directly. {e}")
+                self._invalidate()
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+            finally:
+                try:
+                    pubsub.close()
+                except Exception:
+                    pass
+
+
+status_cache = StatusCache()
@@ -4,14 +4,35 @@ from datetime import datetime
 from dateutil import tz
 import os
 import json # Import json
-from flask import current_app
-from app import socketio # Import socketio instance
+import hashlib
+from flask import current_app, jsonify, request
+from app import emitter # Coalescing wrapper around the socketio instance
+from .status_cache import status_cache, GLOBAL_STATUS_CHANNEL
 
 # Remove the global variable 'current_app_status'
 
 GLOBAL_STATUS_KEY = "global_app_status" # Define a Redis key
+GLOBAL_STATUS_VERSION_KEY = "global_app_status:version" # Bumped on every update, served as the /api/status ETag
+GLOBAL_STATUS_HISTORY_KEY = "global_app_status:history" # Capped stream of every status update
+WEBHOOK_DEDUP_PREFIX = "webhook_dedup" # webhook_dedup:<scope>:<delivery id>, short-lived
 jakarta_tz = tz.gettz('Asia/Jakarta')
 
+# Appends a status update to the history stream (trimmed to roughly ARGV[1]
+# entries), stores it as the current status tagged with its stream ID, bumps
+# the version and publishes status + version to the process caches,
+# atomically. Returns the stream ID.
+# KEYS[1] = history stream, KEYS[2] = current status, KEYS[3] = version
+# ARGV[1] = max length, ARGV[2] = status text, ARGV[3] = last_updated,
+# ARGV[4] = invalidation channel
+_UPDATE_STATUS_LUA = """
+local id = redis.call('XADD', KEYS[1], 'MAXLEN', '~', ARGV[1], '*', 'status', ARGV[2], 'last_updated', ARGV[3])
+local status = {status = ARGV[2], last_updated = ARGV[3], id = id}
+redis.call('SET', KEYS[2], cjson.encode(status))
+local version = redis.call('INCR', KEYS[3])
+redis.call('PUBLISH', ARGV[4], cjson.encode({status = status, version = version}))
+return id
+"""
+
 
 def update_app_status_via_api(status_text):
     """Update global status in Redis and emit Socket.IO event."""
@@ -27,33 +48,145 @@ def update_app_status_via_api(status_text):
             "last_updated": now_iso
         }
         
-        # Store the latest status in Redis
-        redis_conn.set(GLOBAL_STATUS_KEY, json.dumps(status_data))
+        # Record it in the history, store it as the latest status and bump its version in one round-trip
+        status_data['id'] = redis_conn.register_script(_UPDATE_STATUS_LUA)(
+            keys=[GLOBAL_STATUS_HISTORY_KEY, GLOBAL_STATUS_KEY, GLOBAL_STATUS_VERSION_KEY],
+            args=[current_app.config['STATUS_HISTORY_MAXLEN'], status_text, now_iso, GLOBAL_STATUS_CHANNEL],
+        )
         
-        # Emit the update to all connected clients
-        socketio.emit('global_status_update', status_data)
+        # Emit the update to all connected clients; a burst collapses into the latest status
+        emitter.emit('global_status_update', status_data)
         
         print(f"Global status updated via Redis & emitted: {status_text}")
 
     except Exception as e:
         print(f"An unexpected error occurred in update_app_status_via_api: {e}")
 
-# Function to get current status (used by API endpoint and potentially other places)
-def get_current_app_status():
-    """Get the current global status from Redis."""
-    redis_conn = current_app.redis_conn
-    default_status = {"status": "Idle", "last_updated": datetime.now(jakarta_tz).isoformat()}
-    if not redis_conn:
-        return default_status
-        
-    status_json = redis_conn.get(GLOBAL_STATUS_KEY)
+
+def _read_app_status(redis_conn):
+    """Read (status, version) straight from Redis."""
+    status_json, version = redis_conn.mget(GLOBAL_STATUS_KEY, GLOBAL_STATUS_VERSION_KEY)
     if status_json:
         try:
-            return json.loads(status_json)
+            return json.loads(status_json), version or '0'
         except json.JSONDecodeError:
             print("Warning: Could not decode global status JSON from Redis.")
-            return default_status
-    else:
+    default_status = {"status": "Idle", "last_updated": datetime.now(jakarta_tz).isoformat()}
+    if not status_json:
         # Initialize if it doesn't exist
-        redis_conn.set(GLOBAL_STATUS_KEY, json.dumps(default_status))
-        return default_status
\ No newline at end of file
+        redis_conn.set(GLOBAL_STATUS_KEY, json.dumps(default_status), nx=True)
+    return default_status, version or '0'
+
+
+def _cached_app_status():
+    """
+    (status, version) from this process's cache, kept fresh over pub/sub.
+    Falls back to reading Redis while the cache is not (yet) subscribed.
+    """
+    redis_conn = current_app.redis_conn
+    if not redis_conn:
+        return None
+    cached = status_cache.get()
+    if cached is not None:
+        return cached
+    status_cache.start(redis_conn, lambda: _read_app_status(redis_conn))
+    return _read_app_status(redis_conn)
+
+
+# Function to get current status (used by API endpoint and potentially other places)
+def get_current_app_status():
+    """Get the current global status, normally without any Redis I/O."""
+    cached = _cached_app_status()
+    if cached is None:
+        return {"status": "Idle", "last_updated": datetime.now(jakarta_tz).isoformat()}
+    return cached[0]
+
+
+def get_status_history(since=None, limit=100):
+    """
+    Read status updates from the history stream, oldest first.
+
+    With `since` (a stream ID from an earlier update), only the updates after
+    it are returned, up to `limit`, so a client can catch up incrementally.
+    Without it, the latest `limit` updates are returned.
+    """
+    redis_conn = current_app.redis_conn
+    if not redis_conn:
+        return []
+    if since:
+        entries = redis_conn.xrange(GLOBAL_STATUS_HISTORY_KEY, min=f"({since}", max='+', count=limit)
+    else:
+        entries = redis_conn.xrevrange(GLOBAL_STATUS_HISTORY_KEY, max='+', min='-', count=limit)[::-1]
+    return [dict(fields, id=entry_id) for entry_id, fields in entries]
+
+
+def get_status_version():
+    """Current global status version, or None when Redis is unavailable."""
+    cached = _cached_app_status()
+    return cached[1] if cached is not None else None
+
+
+def conditional_json(etag, build_payload):
+    """
+    Answer a GET with 304 Not Modified when the client already holds `etag`,
+    without calling `build_payload`. Otherwise return its result as JSON
+    tagged with the ETag. `Cache-Control: no-cache` makes browsers revalidate
+    on every poll instead of serving a stale copy.
+    """
+    if etag and request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(build_payload())
+    if etag:
+        response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def delivery_id(idempotency_key, *content):
+    """
+    Identifies one webhook delivery: the sender's idempotency key when it
+    gives one, otherwise a hash of the content that makes it unique.
+    """
+    if idempotency_key:
+        return f"key:{idempotency_key}"
+    digest = hashlib.sha1(json.dumps(content, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+    return f"sha1:{digest}"
+
+
+def claim_deliveries(scope, delivery_ids):
+    """
+    Mark webhook deliveries as seen for WEBHOOK_DEDUP_TTL_SECONDS, in one
+    pipelined round-trip of SET NX. Returns one flag per ID: True for the
+    first delivery, False for a duplicate (also for a repeat within the same
+    list). None IDs are not tracked and always count as first. Without Redis
+    every delivery counts as first.
+    """
+    redis_conn = current_app.redis_conn
+    tracked = [i for i, value in enumerate(delivery_ids) if value is not None]
+    claimed = [True] * len(delivery_ids)
+    if not redis_conn or not tracked:
+        return claimed
+    ttl = current_app.config['WEBHOOK_DEDUP_TTL_SECONDS']
+    try:
+        pipe = redis_conn.pipeline(transaction=False)
+        for i in tracked:
+            pipe.set(f"{WEBHOOK_DEDUP_PREFIX}:{scope}:{delivery_ids[i]}", 1, nx=True, ex=ttl)
+        for i, reply in zip(tracked, pipe.execute()):
+            claimed[i] = bool(reply)
+    except Exception as e:
+        # Better to process a retry twice than to drop it
+        print(f"Warning: Could not check webhook deliveries for duplicates: {e}")
+    return claimed
+
+
+def release_deliveries(scope, delivery_ids):
+    """Forget deliveries that failed, so the sender's retry is processed."""
+    redis_conn = current_app.redis_conn
+    keys = [f"{WEBHOOK_DEDUP_PREFIX}:{scope}:{value}" for value in delivery_ids if value is not None]
+    if not redis_conn or not keys:
+        return
+    try:
+        redis_conn.delete(*keys)
+    except Exception as e:
+        print(f"Warning: Could not release webhook deliveries: {e}")
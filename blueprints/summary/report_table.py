@@ -0,0 +1,324 @@
+# blueprints/summary/report_table.py
+import csv
+import hashlib
+import math
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+import numpy as np
+from r2_cache import get_r2_cache
+
+REPORT_VIEW_CACHE_SIZE = 16 # sorted/filtered row orders kept per report
+REPORT_TABLE_FORMAT = 3 # bump when the layout of the prepared files changes
+
+# A report is prepared once per R2 object version: the CSV is parsed into one
+# typed NumPy array per column, plus, for every column, the row order sorted
+# ascending: numbers numerically, then other values by lowercased text, then
+# empty values (descending reverses all but the empty values, as in a
+# spreadsheet). A column whose values are all integers is stored as int64,
+# one whose values are all other numbers as float64, each with a mask of the
+# non-empty cells; a column is only typed when every value prints back as the
+# exact text of the CSV, so pages show what the file holds. Everything else
+# stays a string column. Prepared reports are saved as .npz
+# files in REPORT_TABLE_DIR, shared by every process on the host, so the
+# web workers open a report without parsing the CSV. The Celery task
+# prepare_report builds the file as soon as n8n posts the file_id.
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _typed_column(column):
+    """
+    (kind, values, valid mask) of a string column: 'int' or 'float' with a
+    numeric array when that loses nothing, else 'text' with the strings
+    and no mask.
+    """
+    valid = np.char.str_len(column) > 0
+    texts = column[valid].tolist()
+    if not texts:
+        return 'text', column, None
+    for kind, dtype, parse, fmt in (('int', np.int64, int, str), ('float', np.float64, float, repr)):
+        try:
+            numbers = [parse(text) for text in texts]
+        except ValueError:
+            continue
+        if kind == 'int' and not all(-2 ** 63 <= number < 2 ** 63 for number in numbers):
+            continue
+        if kind == 'float' and not all(math.isfinite(number) for number in numbers):
+            continue
+        if all(fmt(number) == text for number, text in zip(numbers, texts)):
+            values = np.zeros(len(column), dtype=dtype)
+            values[valid] = numbers
+            return kind, values, valid
+    return 'text', column, None
+
+
+def _sort_order(column):
+    """(ascending row order: numbers, then text, then empty values; number of non-empty values)."""
+    missing = np.char.str_len(np.char.strip(column)) == 0
+    numbers = np.array([_number(value) for value in column], dtype=np.float64)
+    numeric = ~missing & ~np.isnan(numbers)
+    groups = np.where(numeric, 0, np.where(missing, 2, 1))
+    texts = np.where(numeric | missing, '', np.char.lower(column))
+    # lexsort sorts by the last key first and is stable: equal values keep their file order
+    order = np.lexsort((texts, np.where(numeric, numbers, 0.0), groups)).astype(np.int32)
+    return order, int(len(column) - missing.sum())
+
+
+def _column_order(kind, values, valid):
+    """_sort_order of a typed column, sorted on its numbers directly."""
+    if kind == 'text':
+        return _sort_order(values)
+    # lexsort sorts by the last key first and is stable: equal values keep their file order
+    return np.lexsort((values, ~valid)).astype(np.int32), int(valid.sum())
+
+
+class ReportTable:
+    """
+    A report CSV held column by column. Sorted and filtered row orders are
+    computed once per (sort, filters) and kept, so paging through a view
+    only slices an array of row numbers.
+    """
+
+    def __init__(self, headers, columns, orders, etag=''):
+        self.headers = headers
+        self.columns = columns # [(kind, values, valid mask or None)] per column
+        self.orders = orders # [(ascending order, non-empty count)] per column
+        self.etag = etag
+        self.row_count = len(columns[0][1]) if columns else 0
+        self._lowered = {}
+        self._views = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_csv(cls, f, etag=''):
+        reader = csv.reader(f)
+        headers = next(reader, [])
+        values = [[] for _ in headers]
+        for row in reader:
+            for index, column in enumerate(values):
+                column.append(row[index] if index < len(row) else '')
+        columns = [_typed_column(np.array(column, dtype=np.str_)) for column in values]
+        return cls(headers, columns, [_column_order(*column) for column in columns], etag)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            if int(data['format']) != REPORT_TABLE_FORMAT:
+                raise ValueError(f"Prepared report {path} has an old format")
+            headers = data['headers'].tolist()
+            columns = []
+            for index, kind in enumerate(data['kinds'].tolist()):
+                valid = data[f'valid_{index}'] if kind != 'text' else None
+                columns.append((kind, data[f'column_{index}'], valid))
+            orders = [(data[f'order_{index}'], int(data['valued'][index])) for index in range(len(headers))]
+            return cls(headers, columns, orders, str(data['etag']))
+
+    def save(self, path):
+        """Write the prepared report to `path` atomically."""
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        arrays = {
+            'format': np.array(REPORT_TABLE_FORMAT),
+            'etag': np.array(self.etag),
+            'headers': np.array(self.headers, dtype=np.str_),
+            'kinds': np.array([kind for kind, _values, _valid in self.columns], dtype=np.str_),
+            'valued': np.array([valued for _order, valued in self.orders], dtype=np.int64),
+        }
+        for index, (_kind, values, valid) in enumerate(self.columns):
+            arrays[f'column_{index}'] = values
+            if valid is not None:
+                arrays[f'valid_{index}'] = valid
+            arrays[f'order_{index}'] = self.orders[index][0]
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, **arrays)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def column_index(self, name):
+        """Index of a column by name, ignoring case and surrounding whitespace; raises ValueError."""
+        wanted = name.strip().lower()
+        for index, header in enumerate(self.headers):
+            if header.strip().lower() == wanted:
+                return index
+        raise ValueError(f"Unknown column '{name}'")
+
+    def _cells(self, index, page):
+        """The cells of column `index` at row numbers `page`, as the CSV text."""
+        kind, values, valid = self.columns[index]
+        if kind == 'text':
+            return values[page].tolist()
+        fmt = str if kind == 'int' else repr
+        return [fmt(value) if ok else '' for value, ok in zip(values[page].tolist(), valid[page].tolist())]
+
+    def _lowered_column(self, index):
+        if index not in self._lowered:
+            kind, values, _valid = self.columns[index]
+            if kind == 'text':
+                self._lowered[index] = np.char.lower(values)
+            else:
+                self._lowered[index] = np.char.lower(np.array(self._cells(index, slice(None)), dtype=np.str_))
+        return self._lowered[index]
+
+    def _order(self, sort, descending, filters):
+        mask = None
+        for index, text in filters:
+            matches = np.char.find(self._lowered_column(index), text) >= 0
+            mask = matches if mask is None else mask & matches
+        if sort is None:
+            if mask is None:
+                return np.arange(self.row_count, dtype=np.int32)
+            return np.flatnonzero(mask).astype(np.int32)
+
+        order, valued = self.orders[sort]
+        if descending:
+            # Empty values stay last
+            order = np.concatenate((order[:valued][::-1], order[valued:]))
+        return order if mask is None else order[mask[order]]
+
+    def view(self, sort=None, descending=False, filters=()):
+        """Row numbers matching `filters` ([(column index, lowercase text)]) in `sort` order."""
+        view_key = (sort, descending, tuple(filters))
+        with self._lock:
+            order = self._views.get(view_key)
+            if order is not None:
+                self._views.move_to_end(view_key)
+                return order
+        order = self._order(sort, descending, filters)
+        with self._lock:
+            self._views[view_key] = order
+            while len(self._views) > REPORT_VIEW_CACHE_SIZE:
+                self._views.popitem(last=False)
+        return order
+
+    def rows(self, order, offset, limit):
+        page = order[offset:offset + limit]
+        return [list(row) for row in zip(*(self._cells(index, page) for index in range(len(self.columns))))]
+
+
+class ReportTableCache:
+    """Per-process LRU of prepared reports in front of their files, keyed by bucket/key and ETag."""
+
+    def __init__(self, table_dir, max_bytes, max_tables):
+        self.table_dir = table_dir
+        self.max_bytes = max_bytes
+        self.max_tables = max_tables
+        self._tables = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, bucket, key):
+        name = hashlib.sha256(f"{bucket}/{key}".encode('utf-8')).hexdigest()
+        return os.path.join(self.table_dir, name + '.npz')
+
+    def _remember(self, bucket, key, table):
+        with self._lock:
+            self._tables[(bucket, key)] = table
+            self._tables.move_to_end((bucket, key))
+            while len(self._tables) > self.max_tables:
+                self._tables.popitem(last=False)
+
+    def get_prepared(self, bucket, key, etag):
+        """The report from memory or from its prepared file when it matches `etag`, else None."""
+        with self._lock:
+            table = self._tables.get((bucket, key))
+            if table is not None and table.etag == etag:
+                self._tables.move_to_end((bucket, key))
+                return table
+        path = self._path(bucket, key)
+        try:
+            table = ReportTable.load(path)
+        except (OSError, ValueError, KeyError):
+            return None # not prepared yet, or an outdated format
+        if table.etag != etag:
+            return None
+        try:
+            os.utime(path) # least recently used files are evicted first
+        except OSError:
+            pass
+        self._remember(bucket, key, table)
+        return table
+
+    def prepare(self, bucket, key, csv_path, etag):
+        """Parse the CSV at `csv_path` and save it as the prepared report."""
+        with open(csv_path, encoding='utf-8', newline='') as f:
+            table = ReportTable.from_csv(f, etag)
+        path = self._path(bucket, key)
+        table.save(path)
+        self._remember(bucket, key, table)
+        print(f"Prepared report '{bucket}/{key}' ({table.row_count} rows, {len(table.headers)} columns).")
+        self.evict(keep=path)
+        return table
+
+    def evict(self, keep=None):
+        """Delete least recently used prepared files until they fit in max_bytes, sparing `keep`."""
+        entries = []
+        total = 0
+        for name in os.listdir(self.table_dir):
+            if not name.endswith('.npz'):
+                continue
+            path = os.path.join(self.table_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue # removed by another process
+            total += stat.st_size
+            if path != keep:
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        removed = 0
+        for _mtime, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+            removed += 1
+        if removed:
+            print(f"Evicted {removed} prepared report(s).")
+        return removed
+
+
+_table_cache = None
+
+
+def _get_table_cache(config):
+    global _table_cache
+    if _table_cache is None:
+        _table_cache = ReportTableCache(
+            os.path.abspath(config['REPORT_TABLE_DIR']), config['REPORT_TABLE_MAX_BYTES'], config['REPORT_TABLE_CACHE_SIZE'],
+        )
+    return _table_cache
+
+
+def get_prepared_report_table(config, s3, bucket, key):
+    """
+    The report `bucket/key` when it has already been prepared for the
+    current version of the object, else None. Nothing is parsed.
+    """
+    r2_cache = get_r2_cache(config)
+    r2_cache.fetch(s3, bucket, key)
+    return _get_table_cache(config).get_prepared(bucket, key, r2_cache.cached_etag(bucket, key))
+
+
+def get_report_table(config, s3, bucket, key):
+    """The report `bucket/key`, prepared now if it has not been yet."""
+    r2_cache = get_r2_cache(config)
+    csv_path = r2_cache.fetch(s3, bucket, key)
+    etag = r2_cache.cached_etag(bucket, key)
+    table_cache = _get_table_cache(config)
+    return table_cache.get_prepared(bucket, key, etag) or table_cache.prepare(bucket, key, csv_path, etag)
@@ -1,62 +1,101 @@
 # blueprints/summary/routes.py
 from datetime import datetime
 from dateutil import tz
-import json
 import redis
-import os
-import csv
-import io
 import uuid
-import boto3
 from flask import Blueprint, render_template, jsonify, current_app, abort, request
+from r2_cache import get_r2_cache
+from r2_storage import get_r2_client
 
-from .task import trigger_n8n_summary_workflow
+from .task import prepare_report, trigger_n8n_summary_workflow
 from ..tasks.utils import store_task_info
+from ..tasks.archive import get_archived_summary, get_archived_summaries
+from .report_table import get_prepared_report_table, get_report_table
+from .utils import (
+    REPORT_TABLE_ROWS, date_score, get_summary_result, list_summary_history, prune_summary_history,
+    read_report_rows, report_object_key,
+)
 
 summary_bp = Blueprint('summary', __name__, template_folder='../../templates')
 
 
+RANGKUMAN_PAGE_SIZE = 20
+RANGKUMAN_MAX_PAGE_SIZE = 100
+RANGKUMAN_PRUNE_ATTEMPTS = 3 # page reads while dropping history entries whose result is gone
+
+
 @summary_bp.route('/rangkuman')
 def rangkuman():
     """
     Renders the summary agent page, displaying a list of historical tasks
-    with data received from the n8n workflow.
+    with data received from the n8n workflow, newest report date first.
+
+    `?page=` and `?per_page=` page through the history and `?from=` /
+    `?to=` (YYYY-MM-DD) limit it to a range of report dates. A page is read
+    in one round-trip whatever the size of the history.
     """
+    page = request.args.get('page', default=1, type=int)
+    per_page = request.args.get('per_page', default=RANGKUMAN_PAGE_SIZE, type=int)
+    date_from = request.args.get('from') or None
+    date_to = request.args.get('to') or None
+    if page is None or page < 1 or per_page is None or not 1 <= per_page <= RANGKUMAN_MAX_PAGE_SIZE:
+        abort(400, description=f"'page' must be 1 or more and 'per_page' between 1 and {RANGKUMAN_MAX_PAGE_SIZE}.")
+    try:
+        for value in (date_from, date_to):
+            if value:
+                date_score(value)
+    except ValueError:
+        abort(400, description="'from' and 'to' must be dates in YYYY-MM-DD format.")
+
     tasks = []
+    total = 0
     try:
-        redis_client = redis.Redis(
-            host=current_app.config['REDIS_HOST'],
-            port=current_app.config['REDIS_PORT'],
-            db=0,
-            decode_responses=True
-        )
-        task_ids = redis_client.lrange('summary_task_history', 0, -1)
-        for task_id in task_ids:
-            task_data_json = redis_client.get(f'summary_result:{task_id}')
-            if task_data_json:
-                
-                # --- START FIX 1 (Fixes TypeError) ---
-                task_data_list = json.loads(task_data_json)
-                
-                task_data_dict = {}
-                if isinstance(task_data_list, list) and task_data_list:
-                    task_data_dict = task_data_list[0] # Get dict from list
-                elif isinstance(task_data_list, dict):
-                    task_data_dict = task_data_list # Handle old data
-                else:
-                    continue # Skip empty or invalid data
-
-                # Add task_id to the DICTIONARY
-                task_data_dict['task_id'] = task_id
-                task_data_dict['workflow_task_id'] = task_id
-                
-                # Append the DICTIONARY to the tasks list
-                tasks.append(task_data_dict)
-                # --- END FIX 1 ---
+        if not current_app.redis_conn:
+            raise redis.exceptions.ConnectionError("Redis connection not available")
+        for _attempt in range(RANGKUMAN_PRUNE_ATTEMPTS):
+            # Only the listing fields; the compressed report bodies are not read
+            entries, total = list_summary_history(page, per_page, date_from, date_to)
+            # Results that already left Redis are read back from the task archive in one query
+            unstored = [entry['task_id'] for entry in entries if not entry['stored']]
+            try:
+                archived = get_archived_summaries(unstored, raise_errors=True)
+            except Exception:
+                archived = None # archive unreachable: nothing is known to be gone
+            gone = [task_id for task_id in unstored if archived is not None and task_id not in archived]
+            if not gone:
+                break
+            # Drop entries whose result is gone everywhere and read the page again,
+            # so the page is full and the total only counts what can be shown
+            prune_summary_history(gone)
+        else:
+            entries = [entry for entry in entries if entry['task_id'] not in gone]
+            total -= len(gone)
+
+        for entry in entries:
+            task_id = entry['task_id']
+            task_data = entry['summary'] or (archived or {}).get(task_id)
+            if isinstance(task_data, list):
+                task_data = task_data[0] if task_data else None
+            # An entry without listing fields still gets its row, so pages match the total
+            task_data_dict = dict(task_data) if isinstance(task_data, dict) else {}
+            task_data_dict['task_id'] = task_id
+            task_data_dict['workflow_task_id'] = task_id
+            tasks.append(task_data_dict)
 
     except redis.exceptions.ConnectionError:
         pass
-    return render_template('rangkuman.html', tasks=tasks)
+    return render_template(
+        'rangkuman.html',
+        tasks=tasks,
+        page=page,
+        per_page=per_page,
+        total=total,
+        total_pages=max(1, -(-total // per_page)),
+        date_from=date_from or '',
+        date_to=date_to or '',
+        # Query args the pagination links carry over
+        page_args={key: value for key, value in (('per_page', per_page), ('from', date_from), ('to', date_to)) if value},
+    )
 
 
 @summary_bp.route('/summary/start', methods=['POST'])
@@ -115,18 +154,16 @@ def show_summary_result(task_id):
     Sorts the displayed CSV data by Product ID.
     """
     try:
-        redis_client = redis.Redis(
-            host=current_app.config['REDIS_HOST'],
-            port=current_app.config['REDIS_PORT'],
-            db=0,
-            decode_responses=True
-        )
-
-        result_data_json = redis_client.get(f'summary_result:{task_id}')
-        if not result_data_json:
-            abort(404, description="Result for this task not found. It might still be processing.")
+        redis_client = current_app.redis_conn
+        if not redis_client:
+            raise redis.exceptions.ConnectionError("Redis connection not available")
 
-        result_data = json.loads(result_data_json) # This will be a list [..]
+        result_data = get_summary_result(task_id) # This will be a list [..]
+        if not result_data:
+            # Older results live in the task archive
+            result_data = get_archived_summary(task_id)
+            if not result_data:
+                abort(404, description="Result for this task not found. It might still be processing.")
 
         # Get the dictionary from the list to access its keys
         result_dict = {}
@@ -139,7 +176,7 @@ def show_summary_result(task_id):
         
         # --- START FIX 2 (Fixes missing 'file_id') ---
         # Access the dictionary (result_dict), not the list (result_data)
-        object_key = result_dict.get('file_id') 
+        object_key = report_object_key(result_dict)
         # --- END FIX 2 ---
 
         if not object_key:
@@ -148,88 +185,48 @@ def show_summary_result(task_id):
                 file_content_error=f"Report file path ('file_id') not found in the summary result for task {task_id}."
             )
 
-        if not object_key.lower().endswith('.csv'):
-            object_key += '.csv'
-            print(f"Appended .csv to object_key. Now using: {object_key}")
-
-
         # Cloudflare R2 S3-compatible configuration
-        r2_access_key = current_app.config.get('R2_ACCESS_KEY_ID')
-        r2_secret_key = current_app.config.get('R2_SECRET_ACCESS_KEY')
-        r2_account_id = current_app.config.get('R2_ACCOUNT_ID')
-        r2_endpoint_url = current_app.config.get('R2_ENDPOINT_URL')
-        r2_region = current_app.config.get('R2_REGION', 'auto')
-        r2_bucket = current_app.config.get('R2_BUCKET_NAME', 'skripsi')
-
-        if not r2_endpoint_url:
-            if not r2_account_id:
-                return render_template(
-                    'hasil_rangkuman.html', result=result_data, task_id=task_id, csv_headers=[], csv_rows=[],
-                    file_content_error="R2 endpoint not configured. Set R2_ENDPOINT_URL or R2_ACCOUNT_ID."
-                )
-            r2_endpoint_url = f"https://{r2_account_id}.r2.cloudflarestorage.com"
-
-        if not (r2_access_key and r2_secret_key):
+        try:
+            s3, r2_bucket = get_r2_client(current_app.config)
+        except ValueError as e:
             return render_template(
                 'hasil_rangkuman.html', result=result_data, task_id=task_id, csv_headers=[], csv_rows=[],
-                file_content_error="R2 credentials not configured. Set R2_ACCESS_KEY_ID and R2_SECRET_ACCESS_KEY."
+                file_content_error=str(e)
             )
 
-        s3 = boto3.client(
-            's3',
-            aws_access_key_id=r2_access_key,
-            aws_secret_access_key=r2_secret_key,
-            endpoint_url=r2_endpoint_url,
-            region_name=r2_region,
-        )
-
         csv_headers = []
         csv_rows = []
+        rows_source = 'table' # 'stream' when the rows were not read from the prepared report
         file_content_error = None
 
         try:
             print(f"Attempting to download R2 object: Bucket='{r2_bucket}', Key='{object_key}'")
-            obj = s3.get_object(Bucket=r2_bucket, Key=object_key)
-            with io.TextIOWrapper(obj['Body'], encoding='utf-8') as f:
-                reader = csv.reader(f)
-                temp_rows = [] # Use a temporary list to store rows before sorting
-                for i, row in enumerate(reader):
-                    if i == 0:
-                        csv_headers = row
-                    else:
-                        temp_rows.append(row) # Add to temporary list
-
-            print(f"Successfully downloaded {len(temp_rows)} data rows from {object_key}")
-
-            # --- START SORTING LOGIC ---
-            if temp_rows:
-                # Find the index of 'PRODUCT ID' (case-insensitive)
-                product_id_index = -1
-                if csv_headers:
-                    try:
-                        # Find the index, ignoring case and stripping whitespace
-                        product_id_index = [h.strip().lower() for h in csv_headers].index('product id')
-                    except ValueError:
-                        print("Warning: 'PRODUCT ID' header not found. Cannot sort by Product ID.")
-                        csv_rows = temp_rows # Use unsorted rows if header not found
-
-                if product_id_index != -1:
-                    def sort_key(row):
-                        try:
-                            # Attempt to convert the value at the found index to an integer
-                            return int(row[product_id_index])
-                        except (ValueError, IndexError):
-                            # If conversion fails or index is out of bounds,
-                            # return a large number to place it at the end
-                            return float('inf')
-
-                    temp_rows.sort(key=sort_key)
-                    print(f"Sorted {len(temp_rows)} rows by Product ID (Column Index: {product_id_index}).")
-                    csv_rows = temp_rows[:501] # Apply limit *after* sorting
-                else:
-                    csv_rows = temp_rows[:501] # Apply limit even if sorting failed
-            # --- END SORTING LOGIC ---
-
+            # Reports are immutable once written: repeat views are read from the local
+            # cache, revalidated against R2 with If-None-Match once in a while. The
+            # report is normally prepared by prepare_report when n8n posted the file_id
+            table = get_prepared_report_table(current_app.config, s3, r2_bucket, object_key)
+            if table is not None:
+                try:
+                    sort = table.column_index('product id')
+                except ValueError:
+                    sort = None
+                csv_headers = table.headers
+                csv_rows = table.rows(table.view(sort), 0, REPORT_TABLE_ROWS)
+                total_rows = table.row_count
+            else:
+                local_path = get_r2_cache(current_app.config).fetch(s3, r2_bucket, object_key)
+                with open(local_path, encoding='utf-8', newline='') as f:
+                    # Streams the file, keeping only the rows shown (smallest Product IDs first).
+                    # Ties may be ordered differently than in the prepared report, so the page
+                    # reloads these rows from the rows API before paging further
+                    csv_headers, csv_rows, total_rows = read_report_rows(f, REPORT_TABLE_ROWS)
+                rows_source = 'stream'
+                try:
+                    prepare_report.delay(object_key)
+                except Exception as e:
+                    print(f"Warning: Could not queue report preparation of '{object_key}': {e}")
+
+            print(f"Successfully read {total_rows} data rows from {object_key}")
 
         except s3.exceptions.NoSuchKey:
              file_content_error = f"Error: The specified report file was not found in R2: '{r2_bucket}/{object_key}'"
@@ -244,10 +241,87 @@ def show_summary_result(task_id):
             task_id=task_id,
             csv_headers=csv_headers,
             csv_rows=csv_rows, # Pass the sorted (and limited) rows
+            rows_source=rows_source,
             file_content_error=file_content_error
         )
 
     except redis.exceptions.ConnectionError:
         abort(503, description="Could not connect to the database to retrieve results.")
     except Exception as e:
-        abort(500, description=f"An unexpected error occurred: {e}")
\ No newline at end of file
+        abort(500, description=f"An unexpected error occurred: {e}")
+
+REPORT_ROWS_PAGE_SIZE = 100
+REPORT_ROWS_MAX_PAGE_SIZE = 1000
+
+
+@summary_bp.route('/api/rangkuman/<task_id>/rows')
+def get_summary_report_rows(task_id):
+    """
+    One page of the report CSV of a summary, for paging through the whole
+    report from the result page.
+    Query parameters:
+    - offset, limit: the page (limit 1-1000, default 100)
+    - sort: a column name, '-' prefixed for descending (default: file order)
+    - filter: 'column:text', repeatable; keeps rows whose column contains
+      the text, ignoring case
+    The report is read from its prepared columnar file (prepared here when
+    prepare_report has not run yet) and kept in memory, with the row order
+    of each sort/filter combination, so a request only copies out its page.
+    """
+    try:
+        offset = int(request.args.get('offset', 0))
+        limit = int(request.args.get('limit', REPORT_ROWS_PAGE_SIZE))
+    except ValueError:
+        return jsonify({"error": "offset and limit must be integers"}), 400
+    if offset < 0 or not 1 <= limit <= REPORT_ROWS_MAX_PAGE_SIZE:
+        return jsonify({"error": f"offset must be >= 0 and limit between 1 and {REPORT_ROWS_MAX_PAGE_SIZE}"}), 400
+
+    try:
+        result_data = get_summary_result(task_id) or get_archived_summary(task_id)
+    except redis.exceptions.ConnectionError:
+        return jsonify({"error": "Could not connect to the database to retrieve results."}), 503
+    if not result_data:
+        return jsonify({"error": "Result for this task not found."}), 404
+    object_key = report_object_key(result_data)
+    if not object_key:
+        return jsonify({"error": f"Report file path ('file_id') not found in the summary result for task {task_id}."}), 404
+
+    try:
+        s3, r2_bucket = get_r2_client(current_app.config)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 503
+    try:
+        table = get_report_table(current_app.config, s3, r2_bucket, object_key)
+    except s3.exceptions.NoSuchKey:
+        return jsonify({"error": f"The specified report file was not found in R2: '{r2_bucket}/{object_key}'"}), 404
+    except Exception as e:
+        print(f"Error loading report rows of {task_id}: {e}")
+        return jsonify({"error": f"Failed to download or parse R2 object '{r2_bucket}/{object_key}': {e}"}), 502
+
+    sort = request.args.get('sort', '').strip()
+    filters = request.args.getlist('filter')
+    try:
+        sort_index = table.column_index(sort.lstrip('-')) if sort else None
+        filter_items = []
+        for item in filters:
+            column, sep, text = item.partition(':')
+            if not sep:
+                raise ValueError(f"Invalid filter '{item}', expected column:text")
+            if text.strip():
+                filter_items.append((table.column_index(column), text.strip().lower()))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    order = table.view(sort_index, sort.startswith('-'), filter_items)
+    return jsonify({
+        "task_id": task_id,
+        "file_id": object_key,
+        "headers": table.headers,
+        "total_rows": table.row_count,
+        "matched_rows": len(order),
+        "offset": offset,
+        "limit": limit,
+        "sort": sort or None,
+        "filters": filters,
+        "rows": table.rows(order, offset, limit),
+    })
@@ -3,6 +3,8 @@ import requests
 from flask import current_app
 from celery_app import celery
 import os
+from r2_storage import get_r2_client
+from .report_table import get_report_table
 
 
 @celery.task(bind=True)
@@ -50,4 +52,25 @@ def trigger_n8n_summary_workflow(self, workflow_task_id, date_str):
         return {'status': 'FAILURE', 'message': f'Failed to trigger n8n: {e}', 'workflow_task_id': workflow_task_id}
     except ValueError as e:
         self.update_state(state='FAILURE', meta={'status': f'Configuration error: {e}'})
-        return {'status': 'FAILURE', 'message': f'Configuration error: {e}', 'workflow_task_id': workflow_task_id}
\ No newline at end of file
+        return {'status': 'FAILURE', 'message': f'Configuration error: {e}', 'workflow_task_id': workflow_task_id}
+
+@celery.task(bind=True, max_retries=3, default_retry_delay=30)
+def prepare_report(self, object_key):
+    """
+    Celery task that downloads the report CSV `object_key` from R2 into the
+    local object cache and prepares it for paging and sorting (see
+    report_table.py), so the result page and /api/rangkuman/<task_id>/rows
+    open it without parsing the CSV. Queued when n8n posts a file_id.
+    """
+    try:
+        s3, r2_bucket = get_r2_client(current_app.config)
+    except ValueError as e:
+        print(f"Skipping report preparation of '{object_key}': {e}")
+        return {'status': 'SKIPPED', 'message': str(e), 'object_key': object_key}
+
+    try:
+        table = get_report_table(current_app.config, s3, r2_bucket, object_key)
+    except s3.exceptions.NoSuchKey:
+        # n8n can post the file_id before the upload is visible
+        raise self.retry(exc=FileNotFoundError(f"Report file not found in R2: '{r2_bucket}/{object_key}'"))
+    return {'status': 'SUCCESS', 'object_key': object_key, 'rows': table.row_count}
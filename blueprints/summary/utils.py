@@ -0,0 +1,506 @@
+# blueprints/summary/utils.py
+import csv
+import heapq
+import json
+import time
+import zlib
+from itertools import islice
+from datetime import datetime
+import redis
+from flask import current_app
+from redis_setup import get_redis_client
+from ..tasks.utils import (
+    TASK_INDEX_KEY, TASK_TTL_SECONDS, TERMINAL_TASK_STATUSES, _TRANSITION_LUA, _emit_task_delta,
+)
+
+REPORT_TABLE_ROWS = 501 # rows of the report CSV shown on the result page
+SUMMARY_RESULT_TTL_SECONDS = 604800 # summary_result:<id> lives for 7 days
+# Summary history index: task IDs scored by the report date as YYYYMMDD (0 when
+# unknown). The expiry set holds when each entry's summary_result expires; the
+# archiver removes an entry from it once the result is safe in the task
+# archive, and list_summary_history prunes everything else that has expired.
+SUMMARY_HISTORY_KEY = "summary_history"
+SUMMARY_HISTORY_EXPIRY_KEY = "summary_history:expiry"
+LEGACY_SUMMARY_HISTORY_KEY = "summary_task_history" # the old unbounded LPUSH list
+SUMMARY_HISTORY_PRUNE_BATCH = 500 # expired entries dropped per listing call, at most
+SUMMARY_COMPLETE_FIELDS = ('total_products', 'top_5_understocked') # the stats part and the top-5 part
+# Small fields the /rangkuman listing shows; they are always stored as plain JSON
+SUMMARY_LISTING_FIELDS = (
+    'date', 'total_products', 'file_id', 'insufficient_stock_count', 'zero_stock_count', 'average_daily_sales',
+)
+COMPRESSED_PREFIX = b'z:' # marks a zlib-compressed field value
+COMPRESS_MIN_BYTES = 256 # smaller values are not worth compressing
+
+# summary_result:<task_id> is a hash with one field per top-level key of the
+# result, each holding its compact JSON-encoded value. Values of the large
+# fields (the LLM report sections) are zlib-compressed and prefixed with
+# COMPRESSED_PREFIX, so they are read with a binary client; the listing
+# fields stay plain and are read with HMGET, without touching the bodies.
+# n8n posts the result in parts, often concurrently; merging a part is an
+# HSET, so parts never overwrite each other. Results written before this
+# layout are plain JSON strings.
+
+
+def summary_result_key(task_id):
+    return f"summary_result:{task_id}"
+
+
+# Merges one part of a summary result, (re-)indexes the task in the history
+# by its report date, and moves the task to 'Prediksi Selesai' once both
+# parts are in (to 'Processing' before that), atomically.
+# KEYS[1] = summary_result:<id>, KEYS[2] = summary history, KEYS[3] = task:<id>,
+# KEYS[4] = main task index, KEYS[5] = summary history expiry set
+# ARGV[1] = task id, ARGV[2] = result TTL, ARGV[3] = task TTL,
+# ARGV[4] = number of fields n, ARGV[5 .. 4+2n] = field/encoded value pairs,
+# then the completion fields (2), then the terminal statuses
+# Returns {created, complete, transition applied, task version, task status},
+# or {-1} when the result is still a legacy JSON string.
+_MERGE_SUMMARY_LUA = _TRANSITION_LUA + """
+local key = KEYS[1]
+local created = 0
+local key_type = redis.call('TYPE', key)['ok']
+if key_type == 'none' then
+    created = 1
+elseif key_type == 'string' then
+    -- A result stored before the hash layout: the caller migrates it and retries
+    return {-1}
+end
+
+local n = tonumber(ARGV[4])
+if n > 0 then
+    redis.call('HSET', key, unpack(ARGV, 5, 4 + 2 * n))
+end
+local rest = 5 + 2 * n
+
+-- Results without a date take the task's prediction date (or creation date)
+local date = redis.call('HGET', key, 'date')
+if not date or date == '""' or date == 'null' then
+    local info = redis.call('HMGET', KEYS[3], 'prediction_date', 'created_at')
+    local source = info[1]
+    if not source or source == '' then
+        source = info[2]
+    end
+    if source and source ~= '' then
+        redis.call('HSET', key, 'date', cjson.encode(string.match(source, '^[^T]*')))
+    end
+end
+redis.call('EXPIRE', key, ARGV[2])
+
+local y, m, d = string.match(redis.call('HGET', key, 'date') or '', '(%d%d%d%d)%-(%d%d)%-(%d%d)')
+redis.call('ZADD', KEYS[2], y and tonumber(y .. m .. d) or 0, ARGV[1])
+local now = redis.call('TIME')
+redis.call('ZADD', KEYS[5], now[1] * 1000 + math.floor(now[2] / 1000) + tonumber(ARGV[2]) * 1000, ARGV[1])
+
+local complete = 0
+local status, message = 'Processing', 'Received partial data from n8n...'
+if redis.call('HEXISTS', key, ARGV[rest]) == 1 and redis.call('HEXISTS', key, ARGV[rest + 1]) == 1 then
+    complete = 1
+    status, message = 'Prediksi Selesai', 'Analysis complete. Report received from n8n.'
+end
+local result = transition(KEYS[3], KEYS[4], ARGV[1], status, true, message, ARGV[3], '', '',
+                          terminal_set({unpack(ARGV, rest + 2)}))
+return {created, complete, result[1], result[2], result[3]}
+"""
+
+
+# Fetches one page of the summary history in a single round-trip: prunes up
+# to ARGV[6] entries whose result expired, then reads the page of task IDs
+# newest report date first, and the listing fields of each result.
+# KEYS[1] = summary history, KEYS[2] = summary history expiry set
+# ARGV[1] = now ms, ARGV[2] = max date score, ARGV[3] = min date score,
+# ARGV[4] = offset, ARGV[5] = page size, ARGV[6] = prune batch,
+# ARGV[7..] = listing fields
+# Returns {total in range, pruned, task IDs, rows}; each row is
+# {'hash', values...}, {'string', legacy JSON} or {'none'}.
+_LIST_SUMMARY_HISTORY_LUA = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1], 'LIMIT', 0, ARGV[6])
+if #expired > 0 then
+    redis.call('ZREM', KEYS[1], unpack(expired))
+    redis.call('ZREM', KEYS[2], unpack(expired))
+end
+local total = redis.call('ZCOUNT', KEYS[1], ARGV[3], ARGV[2])
+local ids = redis.call('ZREVRANGEBYSCORE', KEYS[1], ARGV[2], ARGV[3], 'LIMIT', ARGV[4], ARGV[5])
+local rows = {}
+for i, id in ipairs(ids) do
+    local key = 'summary_result:' .. id
+    local key_type = redis.call('TYPE', key)['ok']
+    local row = {key_type}
+    if key_type == 'hash' then
+        for _, value in ipairs(redis.call('HMGET', key, unpack(ARGV, 7))) do
+            table.insert(row, value)
+        end
+    elseif key_type == 'string' then
+        table.insert(row, redis.call('GET', key))
+    end
+    rows[i] = row
+end
+return {total, #expired, ids, rows}
+"""
+
+
+# Drops history entries whose summary_result no longer exists, re-checked
+# here so an entry written since the caller looked is kept.
+# KEYS[1] = summary history, KEYS[2] = summary history expiry set
+# ARGV = task IDs. Returns the number of entries dropped.
+_PRUNE_SUMMARY_HISTORY_LUA = """
+local pruned = 0
+for _, id in ipairs(ARGV) do
+    if redis.call('EXISTS', 'summary_result:' .. id) == 0 then
+        pruned = pruned + redis.call('ZREM', KEYS[1], id)
+        redis.call('ZREM', KEYS[2], id)
+    end
+end
+return pruned
+"""
+
+
+def unwrap_summary_part(new_data):
+    """
+    The result fields in one n8n callback: the first item of a list, with
+    the payload taken out of its 'json' key when n8n wrapped it. file_id
+    gets its .csv extension. Returns None when there is no object to merge.
+    """
+    if isinstance(new_data, list):
+        new_data = new_data[0] if new_data else {}
+    if not isinstance(new_data, dict):
+        return None
+    if 'json' in new_data and isinstance(new_data['json'], dict):
+        new_data = new_data['json']
+    part = dict(new_data)
+    if isinstance(part.get('file_id'), str) and not part['file_id'].endswith('.csv'):
+        part['file_id'] += '.csv' # Add .csv if missing
+    return part
+
+
+def _encode_field(field, value):
+    data = json.dumps(value, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    if field in SUMMARY_LISTING_FIELDS or len(data) < COMPRESS_MIN_BYTES:
+        return data
+    compressed = COMPRESSED_PREFIX + zlib.compress(data, 6)
+    return compressed if len(compressed) < len(data) else data
+
+
+def _decode_field(value):
+    if isinstance(value, bytes) and value.startswith(COMPRESSED_PREFIX):
+        value = zlib.decompress(value[len(COMPRESSED_PREFIX):])
+    if isinstance(value, bytes):
+        value = value.decode('utf-8')
+    try:
+        return json.loads(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def merge_summary_result(task_id, part):
+    """
+    Merge one unwrapped part of a summary result in a single atomic
+    round-trip, index the task in the summary history and advance its
+    status. Returns {'created', 'complete', 'status'}.
+    """
+    redis_conn = current_app.redis_conn
+    fields = []
+    for field, value in part.items():
+        fields.extend([field, _encode_field(field, value)])
+    merge = redis_conn.register_script(_MERGE_SUMMARY_LUA)
+    keys = [
+        summary_result_key(task_id), SUMMARY_HISTORY_KEY, f"task:{task_id}", TASK_INDEX_KEY,
+        SUMMARY_HISTORY_EXPIRY_KEY,
+    ]
+    args = [
+        task_id, SUMMARY_RESULT_TTL_SECONDS, TASK_TTL_SECONDS, len(part), *fields,
+        *SUMMARY_COMPLETE_FIELDS, *TERMINAL_TASK_STATUSES,
+    ]
+    reply = merge(keys=keys, args=args)
+    if reply[0] == -1:
+        _migrate_legacy_summary_result(task_id)
+        reply = merge(keys=keys, args=args)
+    created, complete, applied, version, status = reply
+    if applied:
+        _emit_task_delta('updated', {
+            'task_id': task_id, 'version': version, 'status': status,
+            'last_message': (
+                "Analysis complete. Report received from n8n." if complete else "Received partial data from n8n..."
+            ),
+        })
+    elif status is None:
+        print(f"Warning: Cannot update status of unknown task '{task_id}'.")
+    return {'created': bool(created), 'complete': bool(complete), 'status': status}
+
+
+def _migrate_legacy_summary_result(task_id):
+    """
+    Rewrite a summary result stored as one JSON string (the pre-hash layout)
+    as a hash, keeping its TTL. Decoded and re-encoded with json, so values
+    come out exactly as they went in. Done in a WATCH transaction, so a
+    concurrent migration or merge is never overwritten.
+    """
+    key = summary_result_key(task_id)
+    with _binary_conn().pipeline() as pipe:
+        while True:
+            try:
+                pipe.watch(key)
+                if pipe.type(key) != b'string':
+                    return # migrated meanwhile
+                legacy = _decode_legacy(task_id, pipe.get(key))
+                ttl_ms = pipe.pttl(key)
+                if isinstance(legacy, list):
+                    legacy = legacy[0] if legacy else None
+                pipe.multi()
+                pipe.delete(key)
+                if isinstance(legacy, dict) and legacy:
+                    pipe.hset(key, mapping={field: _encode_field(field, value) for field, value in legacy.items()})
+                    if ttl_ms and ttl_ms > 0:
+                        pipe.pexpire(key, ttl_ms)
+                pipe.execute()
+                print(f"Migrated the legacy summary result of task {task_id} to a hash.")
+                return
+            except redis.exceptions.WatchError:
+                continue
+
+
+def _binary_conn():
+    """A client on the shared pool that returns raw bytes, for compressed fields."""
+    return get_redis_client(current_app.config, decode_responses=False)
+
+
+def _decode_legacy(task_id, raw):
+    try:
+        return json.loads(raw) if raw else None
+    except ValueError:
+        print(f"Warning: Corrupted JSON in Redis for {task_id}.")
+        return None
+
+
+def _read_legacy(redis_conn, task_ids, indexes, results):
+    """Fill in results still stored as one JSON string (the pre-hash layout)."""
+    if not indexes:
+        return
+    pipe = redis_conn.pipeline(transaction=False)
+    for i in indexes:
+        pipe.get(summary_result_key(task_ids[i]))
+    for i, raw in zip(indexes, pipe.execute()):
+        results[i] = _decode_legacy(task_ids[i], raw)
+
+
+def get_summary_results(task_ids):
+    """
+    Full summary results of many tasks in one pipelined round-trip, in
+    order, as [dict] lists (None where there is none), with compressed
+    fields expanded.
+    """
+    if not task_ids:
+        return []
+    redis_conn = _binary_conn()
+    pipe = redis_conn.pipeline(transaction=False)
+    for task_id in task_ids:
+        pipe.hgetall(summary_result_key(task_id))
+    replies = pipe.execute(raise_on_error=False)
+
+    results = [
+        [{field.decode('utf-8'): _decode_field(value) for field, value in reply.items()}]
+        if isinstance(reply, dict) and reply else None
+        for reply in replies
+    ]
+    _read_legacy(redis_conn, task_ids, [
+        i for i, reply in enumerate(replies) if isinstance(reply, redis.exceptions.ResponseError)
+    ], results)
+    return results
+
+
+def get_summary_result(task_id):
+    """Full summary result of one task as a [dict] list, or None."""
+    return get_summary_results([task_id])[0]
+
+
+def _listing_from_reply(task_id, kind, values):
+    """Decode one row of _LIST_SUMMARY_HISTORY_LUA into the listing fields, or None."""
+    if kind == 'hash':
+        if not any(values):
+            return None
+        return {field: _decode_field(value) for field, value in zip(SUMMARY_LISTING_FIELDS, values) if value}
+    if kind == 'string':
+        result = _decode_legacy(task_id, values[0])
+        result = result[0] if isinstance(result, list) and result else result
+        if isinstance(result, dict):
+            return {field: result[field] for field in SUMMARY_LISTING_FIELDS if field in result}
+    return None
+
+
+def date_score(date_str):
+    """History index score of a YYYY-MM-DD date; raises ValueError for anything else."""
+    return int(datetime.strptime(date_str, '%Y-%m-%d').strftime('%Y%m%d'))
+
+
+def list_summary_history(page=1, per_page=20, date_from=None, date_to=None):
+    """
+    One page of the summary history, newest report date first, optionally
+    limited to report dates between `date_from` and `date_to` (YYYY-MM-DD,
+    inclusive), in a single round-trip. Expired entries are pruned on the way.
+    Returns (entries, total): entries are {'task_id', 'summary', 'stored'}
+    where summary holds the listing fields, or None when there are none, and
+    stored is False once the result left Redis (it may be in the task archive).
+    """
+    redis_conn = current_app.redis_conn
+    now_ms = int(time.time() * 1000)
+    total, pruned, task_ids, rows = redis_conn.register_script(_LIST_SUMMARY_HISTORY_LUA)(
+        keys=[SUMMARY_HISTORY_KEY, SUMMARY_HISTORY_EXPIRY_KEY],
+        args=[
+            now_ms, date_score(date_to) if date_to else '+inf', date_score(date_from) if date_from else '-inf',
+            (page - 1) * per_page, per_page, SUMMARY_HISTORY_PRUNE_BATCH, *SUMMARY_LISTING_FIELDS,
+        ],
+    )
+    if pruned:
+        print(f"Pruned {pruned} expired entries from the summary history.")
+    entries = [
+        {'task_id': task_id, 'summary': _listing_from_reply(task_id, row[0], row[1:]), 'stored': row[0] != 'none'}
+        for task_id, row in zip(task_ids, rows)
+    ]
+    return entries, total
+
+
+def prune_summary_history(task_ids):
+    """
+    Drop history entries whose result is gone from Redis and, as the caller
+    has checked, from the task archive too. Returns the number dropped.
+    """
+    if not task_ids:
+        return 0
+    pruned = current_app.redis_conn.register_script(_PRUNE_SUMMARY_HISTORY_LUA)(
+        keys=[SUMMARY_HISTORY_KEY, SUMMARY_HISTORY_EXPIRY_KEY], args=task_ids,
+    )
+    if pruned:
+        print(f"Pruned {pruned} summary history entries without a result.")
+    return pruned
+
+
+def migrate_legacy_summary_history(redis_conn):
+    """
+    Move task IDs from the old 'summary_task_history' list into the
+    date-ordered history index. Results that already left Redis are kept
+    only when the task archive has them. Safe to call on every start-up; it
+    is a single EXISTS when nothing is left.
+    """
+    if not redis_conn or not redis_conn.exists(LEGACY_SUMMARY_HISTORY_KEY):
+        return
+    from ..tasks.archive import get_archived_summaries
+
+    task_ids = list(dict.fromkeys(redis_conn.lrange(LEGACY_SUMMARY_HISTORY_KEY, 0, -1)))
+    listings = get_summary_listings(task_ids)
+    pipe = redis_conn.pipeline(transaction=False)
+    for task_id in task_ids:
+        pipe.pttl(summary_result_key(task_id))
+    ttls = pipe.execute()
+    archived = get_archived_summaries([task_id for task_id, listing in zip(task_ids, listings) if not listing])
+
+    now_ms = int(time.time() * 1000)
+    migrated = 0
+    pipe = redis_conn.pipeline()
+    for task_id, listing, ttl in zip(task_ids, listings, ttls):
+        if not listing:
+            listing = archived.get(task_id)
+            listing = listing[0] if isinstance(listing, list) and listing else listing
+            if not isinstance(listing, dict):
+                continue # expired and never archived
+        elif ttl and ttl > 0:
+            pipe.zadd(SUMMARY_HISTORY_EXPIRY_KEY, {task_id: now_ms + ttl}, nx=True)
+        try:
+            score = date_score(str(listing.get('date') or '')[:10])
+        except ValueError:
+            score = 0
+        pipe.zadd(SUMMARY_HISTORY_KEY, {task_id: score}, nx=True)
+        migrated += 1
+    pipe.delete(LEGACY_SUMMARY_HISTORY_KEY)
+    pipe.execute()
+    print(f"Migrated {migrated} summaries from '{LEGACY_SUMMARY_HISTORY_KEY}' into '{SUMMARY_HISTORY_KEY}'.")
+
+
+def get_summary_listings(task_ids):
+    """
+    Only the SUMMARY_LISTING_FIELDS of many summary results, in one
+    pipelined round-trip, as dicts (None where there is none). The large
+    compressed fields are neither transferred nor decompressed.
+    """
+    if not task_ids:
+        return []
+    redis_conn = current_app.redis_conn
+    pipe = redis_conn.pipeline(transaction=False)
+    for task_id in task_ids:
+        pipe.hmget(summary_result_key(task_id), SUMMARY_LISTING_FIELDS)
+    replies = pipe.execute(raise_on_error=False)
+
+    listings = []
+    for reply in replies:
+        if isinstance(reply, list) and any(value is not None for value in reply):
+            listings.append({
+                field: _decode_field(value) for field, value in zip(SUMMARY_LISTING_FIELDS, reply) if value is not None
+            })
+        else:
+            listings.append(None)
+    legacy = [i for i, reply in enumerate(replies) if isinstance(reply, redis.exceptions.ResponseError)]
+    _read_legacy(redis_conn, task_ids, legacy, listings)
+    for i in legacy:
+        result = listings[i][0] if isinstance(listings[i], list) and listings[i] else listings[i]
+        listings[i] = {field: result[field] for field in SUMMARY_LISTING_FIELDS if field in result} if isinstance(result, dict) else None
+    return listings
+
+
+def product_id_sort_key(product_id_index):
+    """Sort key ordering report rows by numeric PRODUCT ID; other IDs sort to the end."""
+    def sort_key(row):
+        try:
+            return int(row[product_id_index])
+        except (ValueError, IndexError):
+            return float('inf')
+    return sort_key
+
+
+class _CountingIterator:
+    """Iterator wrapper counting the items that went through it."""
+
+    def __init__(self, iterable):
+        self._iterator = iter(iterable)
+        self.count = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        item = next(self._iterator)
+        self.count += 1
+        return item
+
+
+def read_report_rows(f, limit=REPORT_TABLE_ROWS):
+    """
+    Stream a report CSV and keep only the `limit` rows with the smallest
+    PRODUCT ID, in that order (file order among equal keys), using a
+    bounded heap: memory stays O(limit) whatever the file size. Without a
+    PRODUCT ID column the first `limit` rows are kept.
+    Returns (headers, rows, number of data rows read).
+    """
+    reader = csv.reader(f)
+    headers = next(reader, [])
+    counted = _CountingIterator(reader)
+    try:
+        # Find the index, ignoring case and stripping whitespace
+        product_id_index = [h.strip().lower() for h in headers].index('product id')
+    except ValueError:
+        print("Warning: 'PRODUCT ID' header not found. Cannot sort by Product ID.")
+        rows = list(islice(counted, limit)) # no need to read further
+        return headers, rows, counted.count
+    rows = heapq.nsmallest(limit, counted, key=product_id_sort_key(product_id_index))
+    print(f"Kept the {len(rows)} smallest of {counted.count} rows by Product ID (Column Index: {product_id_index}).")
+    return headers, rows, counted.count
+
+
+
+def report_object_key(result_data):
+    """R2 key of the report CSV of a summary result ([dict] or dict), with .csv ensured; None without file_id."""
+    result_dict = result_data[0] if isinstance(result_data, list) and result_data else result_data
+    object_key = result_dict.get('file_id') if isinstance(result_dict, dict) else None
+    if not object_key or not isinstance(object_key, str):
+        return None
+    if not object_key.lower().endswith('.csv'):
+        object_key += '.csv'
+    return object_key
+
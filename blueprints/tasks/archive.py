@@ -0,0 +1,266 @@
+# blueprints/tasks/archive.py
+import json
+import time
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import Table, Column, MetaData, Index, String, Text, Integer, Float, DateTime, JSON, select, delete, or_
+from sqlalchemy.dialects.postgresql import insert
+from db_setup import db
+
+# Cold tier of the task store. Finished tasks are copied here from Redis by
+# the periodic archive_finished_tasks job and then evicted from Redis, so
+# Redis only keeps the hot working set while the history stays queryable.
+archive_metadata = MetaData(schema="public")
+
+task_archive = Table(
+    'task_archive', archive_metadata,
+    Column('task_id', String(255), primary_key=True),
+    Column('task_name', Text),
+    Column('filename', Text),
+    Column('status', String(64), nullable=False),
+    Column('last_message', Text),
+    Column('workflow_type', String(64)),
+    Column('created_at', Text),
+    # Same score as the Redis task index, so both tiers share one cursor
+    Column('created_score', Float, nullable=False),
+    Column('version', Integer),
+    Column('archived_at', DateTime(timezone=True), nullable=False),
+    Column('task_info', JSON, nullable=False), # task:<id> hash, workflow_finish applied
+    Column('workflow_state', JSON(none_as_null=True)), # workflow_state:<id> step timeline
+    Column('summary_result', JSON(none_as_null=True)), # summary_result:<id> payload
+    Index('ix_task_archive_created_score', 'created_score'),
+    Index('ix_task_archive_status_created_score', 'status', 'created_score'),
+    Index('ix_task_archive_workflow_type_created_score', 'workflow_type', 'created_score'),
+)
+
+
+def ensure_archive_table():
+    """Create the task_archive table and its indexes if they do not exist yet."""
+    task_archive.create(db.engine, checkfirst=True)
+
+
+def _decode_json(value):
+    if not value:
+        return None
+    try:
+        return json.loads(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def _prune_stale_index_entries(redis_conn, task_ids):
+    """
+    Drop index entries whose task:<id> hash has expired from the main index,
+    the terminal status indexes and the workflow_type indexes.
+    """
+    from .utils import TASK_INDEX_KEY, TERMINAL_TASK_STATUSES, task_field_index_key
+
+    pipe = redis_conn.pipeline(transaction=False)
+    pipe.zrem(TASK_INDEX_KEY, *task_ids)
+    for status in TERMINAL_TASK_STATUSES:
+        pipe.zrem(task_field_index_key('status', status), *task_ids)
+    # The expired hash no longer says which workflow_type it had
+    for workflow_type in current_app.config.get('WORKFLOWS') or {}:
+        pipe.zrem(task_field_index_key('workflow_type', workflow_type), *task_ids)
+    pipe.execute()
+    print(f"Removed {len(task_ids)} expired task(s) from the task indexes.")
+
+
+def _next_archive_cursor(position, offset, kept, exhausted):
+    """Cursor after a batch: past the `kept` entries, or on to the next status once this one is exhausted."""
+    from .utils import TERMINAL_TASK_STATUSES
+
+    if not exhausted:
+        return position, offset + kept
+    return (position + 1, 0) if position + 1 < len(TERMINAL_TASK_STATUSES) else None
+
+
+def archive_finished_tasks(min_age_seconds, batch_size, cursor=None):
+    """
+    Move one batch of finished tasks from Redis into task_archive.
+
+    Candidates come from the per-status indexes of the terminal statuses, so
+    running tasks are never scanned. A task is archived once its last write
+    is at least `min_age_seconds` old. Rows are inserted first and committed;
+    only then is the task evicted from Redis, and only if it was not written
+    to in the meantime. Index entries whose task hash already expired are
+    removed.
+
+    The indexes are walked one terminal status at a time. `cursor` is the
+    (status position, offset) returned by the previous call; the offset
+    steps past entries that were left in the index (finished too recently,
+    or written to meanwhile), so they never stall the walk. Returns
+    (number of tasks archived, next cursor), the cursor None once every
+    terminal status index has been walked.
+    """
+    from .utils import (
+        TERMINAL_TASK_STATUSES, task_field_index_key, evict_archived_task,
+        _apply_workflow_finish, _created_score,
+    )
+    from ..summary.utils import get_summary_results
+
+    redis_conn = current_app.redis_conn
+    if not redis_conn:
+        print("Warning: Redis connection not available, skipping task archive.")
+        return 0, None
+
+    position, offset = cursor or (0, 0)
+    if position >= len(TERMINAL_TASK_STATUSES):
+        return 0, None
+    cutoff_ms = (time.time() - min_age_seconds) * 1000
+    # Index scores are created_at, which is always before the last write
+    task_ids = redis_conn.zrangebyscore(
+        task_field_index_key('status', TERMINAL_TASK_STATUSES[position]), '-inf', cutoff_ms / 1000,
+        start=offset, num=batch_size,
+    )
+    if not task_ids:
+        return 0, _next_archive_cursor(position, offset, 0, True)
+
+    pipe = redis_conn.pipeline(transaction=False)
+    for task_id in task_ids:
+        pipe.hgetall(f"task:{task_id}")
+        pipe.hgetall(f"workflow_state:{task_id}")
+    stored = pipe.execute()
+    summaries = get_summary_results(task_ids)
+
+    rows = []
+    versions = {}
+    stale = []
+    for i, task_id in enumerate(task_ids):
+        task_info, workflow_state = stored[i * 2:i * 2 + 2]
+        if not task_info:
+            stale.append(task_id) # task:<id> expired, only its index entries are left
+            continue
+        if float(task_info.get('updated_at_ms') or 0) > cutoff_ms:
+            continue # finished too recently
+        if workflow_state:
+            _apply_workflow_finish(task_id, task_info, workflow_state.get('workflow_finish'))
+        rows.append({
+            'task_id': task_id,
+            'task_name': task_info.get('task_name'),
+            'filename': task_info.get('filename'),
+            'status': task_info.get('status') or 'UNKNOWN',
+            'last_message': task_info.get('last_message'),
+            'workflow_type': task_info.get('workflow_type'),
+            'created_at': task_info.get('created_at'),
+            'created_score': _created_score(task_info.get('created_at')),
+            'version': int(task_info.get('version') or 0),
+            'archived_at': datetime.now().astimezone(),
+            'task_info': task_info,
+            'workflow_state': {step: _decode_json(state) for step, state in workflow_state.items()} or None,
+            'summary_result': summaries[i],
+        })
+        versions[task_id] = task_info.get('version') or ''
+    if stale:
+        _prune_stale_index_entries(redis_conn, stale)
+
+    archived = 0
+    if rows:
+        # A task already archived by an earlier run is overwritten when Redis holds
+        # a newer version: that run's eviction was refused because the task was
+        # written to meanwhile, and the Redis copy is about to become the only one
+        insert_stmt = insert(task_archive).values(rows)
+        db.session.execute(insert_stmt.on_conflict_do_update(
+            index_elements=['task_id'],
+            set_={column: insert_stmt.excluded[column] for column in rows[0] if column != 'task_id'},
+            where=or_(task_archive.c.version.is_(None), task_archive.c.version < insert_stmt.excluded.version),
+        ))
+        db.session.commit()
+        archived = sum(1 for task_id, version in versions.items() if evict_archived_task(task_id, version))
+        print(f"Archived {archived} finished tasks to '{task_archive.name}'.")
+
+    # Entries that were neither archived nor pruned are still in the index
+    kept = len(task_ids) - archived - len(stale)
+    return archived, _next_archive_cursor(position, offset, kept, len(task_ids) < batch_size)
+
+
+def get_archived_tasks_page(limit=None, before=None, filters=None):
+    """
+    Page through archived tasks newest first, with the same cursor semantics
+    as get_tasks_page. Returns a list of (task_info, score) tuples.
+    """
+    query = select(task_archive.c.task_info, task_archive.c.created_score).order_by(task_archive.c.created_score.desc())
+    if before is not None:
+        query = query.where(task_archive.c.created_score < before)
+    for field, value in (filters or {}).items():
+        if value:
+            query = query.where(task_archive.c[field] == value)
+    if limit:
+        query = query.limit(limit)
+    try:
+        return [(dict(row.task_info, archived=True), row.created_score) for row in db.session.execute(query)]
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error reading task archive: {e}")
+        return []
+
+
+def get_archived_task(task_id):
+    """Archived task info for a single task, or None."""
+    try:
+        task_info = db.session.execute(
+            select(task_archive.c.task_info).where(task_archive.c.task_id == task_id)
+        ).scalar()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error reading archived task '{task_id}': {e}")
+        return None
+    return dict(task_info, archived=True) if task_info else None
+
+
+def get_archived_workflow_state(task_id):
+    """Archived step timeline of a workflow task as {step_id: state}, or {}."""
+    try:
+        return db.session.execute(
+            select(task_archive.c.workflow_state).where(task_archive.c.task_id == task_id)
+        ).scalar() or {}
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error reading archived workflow state for task '{task_id}': {e}")
+        return {}
+
+
+def get_archived_summary(task_id):
+    """Archived summary_result payload for a task, or None."""
+    try:
+        return db.session.execute(
+            select(task_archive.c.summary_result).where(task_archive.c.task_id == task_id)
+        ).scalar()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error reading archived summary for task '{task_id}': {e}")
+        return None
+
+
+def get_archived_summaries(task_ids, raise_errors=False):
+    """
+    Archived summary_result payloads for many tasks as {task_id: payload}.
+    With raise_errors, a failed read raises instead of returning {}, so a
+    missing task can be told apart from an unreachable archive.
+    """
+    if not task_ids:
+        return {}
+    try:
+        rows = db.session.execute(
+            select(task_archive.c.task_id, task_archive.c.summary_result)
+            .where(task_archive.c.task_id.in_(task_ids), task_archive.c.summary_result.isnot(None))
+        )
+        return {row.task_id: row.summary_result for row in rows}
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error reading archived summaries: {e}")
+        if raise_errors:
+            raise
+        return {}
+
+
+def delete_archived_task(task_id):
+    """Remove a task from the archive. Returns True when a row was deleted."""
+    try:
+        result = db.session.execute(delete(task_archive).where(task_archive.c.task_id == task_id))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error deleting archived task '{task_id}': {e}")
+        return False
+    return result.rowcount > 0
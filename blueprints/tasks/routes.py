@@ -1,14 +1,13 @@
 # blueprints/tasks/routes.py
 from flask import Blueprint, render_template, request, jsonify, current_app
-from .utils import get_all_tasks
 
 tasks_bp = Blueprint('tasks_ui', __name__)
 
 
 @tasks_bp.route('/tasks')
 def tasks():
-    tasks_list = get_all_tasks()
-    return render_template('tasks.html', tasks=tasks_list)
+    # The task list itself is paged in by tasks.js from /api/tasks
+    return render_template('tasks.html')
 
 
 @tasks_bp.route('/prediksi-stok', methods=['GET', 'POST'])
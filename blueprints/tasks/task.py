@@ -0,0 +1,23 @@
+# blueprints/tasks/task.py
+from flask import current_app
+from celery_app import celery
+from .archive import archive_finished_tasks
+
+
+@celery.task(bind=True)
+def archive_tasks(self):
+    """
+    Periodic job (see beat_schedule in celery_app.py) that moves finished
+    tasks from Redis into the Postgres task_archive table, one batch at a
+    time, until every terminal status index has been walked.
+    """
+    min_age = current_app.config['TASK_ARCHIVE_AFTER_SECONDS']
+    batch_size = current_app.config['TASK_ARCHIVE_BATCH_SIZE']
+    total = 0
+    cursor = None
+    while True:
+        archived, cursor = archive_finished_tasks(min_age, batch_size, cursor)
+        total += archived
+        if cursor is None:
+            break
+    return {'status': 'SUCCESS', 'archived': total}
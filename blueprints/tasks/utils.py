@@ -1,79 +1,389 @@
 # blueprints/tasks/utils.py
+import time
 from flask import current_app
 from celery_app import celery
+from app import socketio
+from dateutil import parser
 import json
+from .archive import get_archived_tasks_page
 
+TASK_INDEX_KEY = "task_index" # Sorted set of task IDs scored by created_at (epoch seconds)
+LEGACY_TASK_LIST_KEY = "active_tasks" # Old LPUSH list, migrated into TASK_INDEX_KEY
+TASK_TTL_SECONDS = 86400 # task:<id> hashes live for 24 hours
+TASKS_ROOM = "tasks" # Socket.IO room the tasks page joins for live task_update deltas
+TASKS_VERSION_KEY = f"{TASK_INDEX_KEY}:version" # Bumped by every task write, served as the /api/tasks ETag
 
-def get_all_tasks():
-    """Get all active tasks"""
+# Final states. A task in one of these never moves to another status, so a
+# late or retried callback cannot undo or overwrite a finished task.
+TERMINAL_TASK_STATUSES = ('SUCCESS', 'FAILURE', 'ABORTED', 'REVOKED', 'Prediksi Selesai')
+
+# Secondary indexes share the scores of TASK_INDEX_KEY so they page the same way:
+#   task_index:status:<status>        one per task status
+#   task_index:workflow_type:<type>   one per workflow type
+INDEXED_TASK_FIELDS = ('status', 'workflow_type')
+
+
+def task_field_index_key(field, value):
+    """Name of the secondary index holding tasks whose `field` equals `value`."""
+    return f"{TASK_INDEX_KEY}:{field}:{value}"
+
+
+# Lua helper shared by the write scripts below. It moves a task between the
+# per-status indexes and makes sure it is listed in its workflow_type index,
+# using the task's score in the main index.
+_REINDEX_LUA = """
+local function reindex(index, id, old_status, new_status, workflow_type)
+    local score = redis.call('ZSCORE', index, id)
+    if not score then
+        return
+    end
+    if old_status and old_status ~= new_status then
+        redis.call('ZREM', index .. ':status:' .. old_status, id)
+    end
+    if new_status then
+        redis.call('ZADD', index .. ':status:' .. new_status, score, id)
+    end
+    if workflow_type then
+        redis.call('ZADD', index .. ':workflow_type:' .. workflow_type, score, id)
+    end
+end
+"""
+
+# Every task hash carries two bookkeeping fields written only by these scripts:
+#   version        monotonic counter, +1 on every applied write
+#   updated_at_ms  Redis server time (or the event time) of the last write
+#   created_at_ms  created_at as epoch ms, the start of the run for step timings
+
+# Stores (or re-stores) a task hash and keeps every index in step.
+# KEYS[1] = task:<id>, KEYS[2] = main index
+# ARGV[1] = task id, ARGV[2] = created_at score, ARGV[3] = TTL, ARGV[4..] = field/value pairs
+# Returns {created, version}; created is 1 when the task is new to the index.
+_STORE_TASK_LUA = _REINDEX_LUA + """
+local now = redis.call('TIME')
+local old_status = redis.call('HGET', KEYS[1], 'status')
+redis.call('HSET', KEYS[1], unpack(ARGV, 4))
+redis.call('HSET', KEYS[1], 'updated_at_ms', now[1] * 1000 + math.floor(now[2] / 1000))
+local version = redis.call('HINCRBY', KEYS[1], 'version', 1)
+redis.call('HSETNX', KEYS[1], 'created_at_ms', math.floor(tonumber(ARGV[2]) * 1000))
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+-- NX keeps the original position when a task is stored more than once
+local created = redis.call('ZADD', KEYS[2], 'NX', ARGV[2], ARGV[1])
+local info = redis.call('HMGET', KEYS[1], 'status', 'workflow_type')
+reindex(KEYS[2], ARGV[1], old_status, info[1], info[2])
+redis.call('INCR', KEYS[2] .. ':version')
+return {created, version}
+"""
+
+# Lua helper applying one state transition to an existing task. Also used by
+# other scripts that need to move a task's status as part of a larger atomic
+# write. The transition is refused, leaving the hash untouched, when:
+#   - the task does not exist (it is never re-created here),
+#   - expected_version is given and does not match the stored version,
+#   - at_ms is older than the last applied write (an out-of-order event),
+#   - the task is in a terminal status and the new status is a different one
+#     (neither a running status nor another terminal status, so a late 'fail'
+#     cannot overwrite SUCCESS).
+# Returns {applied, version, status}.
+_TRANSITION_LUA = _REINDEX_LUA + """
+local function transition(task_key, index, id, status, set_message, message, ttl, at_ms, expected_version, terminal)
+    if redis.call('EXISTS', task_key) == 0 then
+        return {0, 0, false}
+    end
+    local current = redis.call('HMGET', task_key, 'status', 'version', 'updated_at_ms')
+    local old_status = current[1]
+    local version = tonumber(current[2]) or 0
+    if expected_version ~= '' and tonumber(expected_version) ~= version then
+        return {0, version, old_status}
+    end
+    if at_ms == '' then
+        local now = redis.call('TIME')
+        at_ms = now[1] * 1000 + math.floor(now[2] / 1000)
+    end
+    at_ms = tonumber(at_ms)
+    if at_ms < (tonumber(current[3]) or 0) then
+        return {0, version, old_status}
+    end
+    if old_status and terminal[old_status] and status ~= '' and status ~= old_status then
+        return {0, version, old_status}
+    end
+
+    local fields = {'updated_at_ms', at_ms}
+    if status ~= '' then
+        table.insert(fields, 'status')
+        table.insert(fields, status)
+    end
+    if set_message then
+        table.insert(fields, 'last_message')
+        table.insert(fields, message)
+    end
+    redis.call('HSET', task_key, unpack(fields))
+    version = redis.call('HINCRBY', task_key, 'version', 1)
+    redis.call('EXPIRE', task_key, ttl)
+
+    local info = redis.call('HMGET', task_key, 'status', 'workflow_type')
+    reindex(index, id, old_status, info[1], info[2])
+    redis.call('INCR', index .. ':version')
+    return {1, version, info[1]}
+end
+
+local function terminal_set(statuses)
+    local set = {}
+    for _, s in ipairs(statuses) do
+        set[s] = true
+    end
+    return set
+end
+"""
+
+# KEYS[1] = task:<id>, KEYS[2] = main index, KEYS[3] = workflow_state:<id>
+# ARGV[1] = task id, ARGV[2] = new status ('' keeps it), ARGV[3] = '1' to store
+# ARGV[4] as last_message, ARGV[5] = TTL, ARGV[6] = event time in ms ('' = now),
+# ARGV[7] = expected version ('' = any), ARGV[8] = workflow_finish state to
+# store in KEYS[3] when the transition is applied ('' = none),
+# ARGV[9..] = terminal statuses
+_TRANSITION_TASK_LUA = _TRANSITION_LUA + """
+local result = transition(KEYS[1], KEYS[2], ARGV[1], ARGV[2], ARGV[3] == '1', ARGV[4], ARGV[5],
+                          ARGV[6], ARGV[7], terminal_set({unpack(ARGV, 9)}))
+if result[1] == 1 and ARGV[8] ~= '' then
+    redis.call('HSET', KEYS[3], 'workflow_finish', ARGV[8])
+end
+return result
+"""
+
+# Deletes a task hash and every index entry pointing at it.
+# KEYS[1] = task:<id>, KEYS[2] = main index, ARGV[1] = task id
+_REMOVE_TASK_LUA = """
+local info = redis.call('HMGET', KEYS[1], 'status', 'workflow_type')
+if info[1] then
+    redis.call('ZREM', KEYS[2] .. ':status:' .. info[1], ARGV[1])
+end
+if info[2] then
+    redis.call('ZREM', KEYS[2] .. ':workflow_type:' .. info[2], ARGV[1])
+end
+redis.call('ZREM', KEYS[2], ARGV[1])
+redis.call('INCR', KEYS[2] .. ':version')
+return redis.call('DEL', KEYS[1])
+"""
+
+# Evicts a task that has just been copied into the archive. Same as
+# _REMOVE_TASK_LUA, plus the workflow_state:<id> timeline and the
+# summary_result:<id> payload, but only when the task was not written to
+# since it was read (its version is unchanged).
+# KEYS[1] = task:<id>, KEYS[2] = main index, KEYS[3] = workflow_state:<id>,
+# KEYS[4] = summary_result:<id>, KEYS[5] = workflow_log:<id>,
+# KEYS[6] = workflow_timing:<id>, KEYS[7] = summary history expiry set (the
+# history entry is kept: its result now lives in the archive)
+# ARGV[1] = task id, ARGV[2] = archived version
+_EVICT_TASK_LUA = """
+local info = redis.call('HMGET', KEYS[1], 'status', 'workflow_type', 'version')
+if (info[3] or '') ~= ARGV[2] then
+    return 0
+end
+if info[1] then
+    redis.call('ZREM', KEYS[2] .. ':status:' .. info[1], ARGV[1])
+end
+if info[2] then
+    redis.call('ZREM', KEYS[2] .. ':workflow_type:' .. info[2], ARGV[1])
+end
+redis.call('ZREM', KEYS[2], ARGV[1])
+redis.call('INCR', KEYS[2] .. ':version')
+redis.call('DEL', KEYS[1], KEYS[3], KEYS[4], KEYS[5], KEYS[6])
+redis.call('ZREM', KEYS[7], ARGV[1])
+return 1
+"""
+
+# Fetches one page of the task listing in a single round-trip. It walks the
+# index KEYS[1] newest-first below ARGV[1] (a ZRANGEBYSCORE bound such as
+# '+inf' or '(1712345678.5'), reads every task:<id> hash and, for workflow
+# tasks, the workflow_finish field of workflow_state:<id>. ARGV[3..] are
+# field/value pairs a task hash must match; the first pair is the field the
+# walked index is keyed on, if any. Entries whose hash has expired, or no
+# longer matches that field, are pruned on the way, so a page is always
+# filled up to ARGV[2] live tasks (0 means no limit).
+# Each entry is {task_id, flat hash, finish, score}.
+_LIST_TASKS_LUA = """
+local index = KEYS[1]
+local max = ARGV[1]
+local limit = tonumber(ARGV[2])
+local chunk = 200
+if limit > 0 and limit < chunk then
+    chunk = limit
+end
+
+local function field(fields, name)
+    for i = 1, #fields, 2 do
+        if fields[i] == name then
+            return fields[i + 1]
+        end
+    end
+    return nil
+end
+
+local out = {}
+local offset = 0
+while true do
+    local batch = redis.call('ZREVRANGEBYSCORE', index, max, '-inf', 'WITHSCORES', 'LIMIT', offset, chunk)
+    if #batch == 0 then
+        break
+    end
+    for i = 1, #batch, 2 do
+        local id = batch[i]
+        local fields = redis.call('HGETALL', 'task:' .. id)
+        if #fields == 0 or (#ARGV >= 4 and field(fields, ARGV[3]) ~= ARGV[4]) then
+            -- task:<id> expired, was deleted or moved to another index: drop the stale entry
+            redis.call('ZREM', index, id)
+        else
+            offset = offset + 1
+            local matches = true
+            for j = 5, #ARGV, 2 do
+                if field(fields, ARGV[j]) ~= ARGV[j + 1] then
+                    matches = false
+                end
+            end
+            if matches then
+                local finish = false
+                if string.sub(id, 1, 9) == 'workflow_' then
+                    finish = redis.call('HGET', 'workflow_state:' .. id, 'workflow_finish')
+                end
+                table.insert(out, {id, fields, finish, batch[i + 1]})
+                if limit > 0 and #out >= limit then
+                    return out
+                end
+            end
+        end
+    end
+    if #batch < chunk * 2 then
+        break
+    end
+end
+return out
+"""
+
+
+def _emit_task_delta(action, task):
+    """
+    Push a small task change ('created', 'updated' or 'removed') to the tasks
+    page. `task` always carries task_id plus only the fields that changed.
+    """
+    try:
+        socketio.emit('task_update', {'action': action, 'task': task}, room=TASKS_ROOM)
+    except Exception as e:
+        print(f"Warning: Could not emit task_update for task '{task.get('task_id')}': {e}")
+
+
+def _created_score(created_at):
+    """Convert a task's created_at ISO string into its index score."""
+    try:
+        return parser.isoparse(created_at).timestamp()
+    except (TypeError, ValueError):
+        return time.time()
+
+
+def _apply_workflow_finish(task_id, task_info, finish_state_json):
+    """Override a workflow task's status with its workflow_finish state, if any."""
+    if not finish_state_json:
+        return
+    try:
+        finish_state = json.loads(finish_state_json)
+        # Use the status from workflow_finish if it's success or fail
+        if finish_state.get('status') in ['success', 'fail']:
+            # Map 'success'/'fail' from workflow state to 'SUCCESS'/'FAILURE'
+            task_info['status'] = "SUCCESS" if finish_state['status'] == 'success' else "FAILURE"
+            task_info['last_message'] = finish_state.get('message', task_info.get('last_message', '')) # Use existing message as fallback
+    except json.JSONDecodeError:
+        print(f"Warning: Could not decode workflow_finish JSON for task {task_id}")
+    except Exception as e:
+        print(f"Error processing workflow_finish state for task '{task_id}': {e}")
+
+
+def _filter_index_and_conditions(redis_conn, filters):
+    """
+    Pick the index to walk for the given {field: value} filters, plus the
+    field/value pairs every task hash must match. The smallest matching
+    secondary index is walked; the other filters are checked per task.
+    """
+    filters = {f: v for f, v in (filters or {}).items() if f in INDEXED_TASK_FIELDS and v}
+    if not filters:
+        return TASK_INDEX_KEY, []
+
+    walked = next(iter(filters))
+    if len(filters) > 1:
+        pipe = redis_conn.pipeline(transaction=False)
+        for f, v in filters.items():
+            pipe.zcard(task_field_index_key(f, v))
+        sizes = dict(zip(filters, pipe.execute()))
+        walked = min(filters, key=sizes.get)
+
+    conditions = [walked, filters[walked]]
+    for f, v in filters.items():
+        if f != walked:
+            conditions += [f, v]
+    return task_field_index_key(walked, filters[walked]), conditions
+
+
+def get_tasks_page(limit=None, before=None, filters=None, include_archive=False):
+    """
+    Get one page of tasks, newest first, in a single Redis round-trip.
+
+    `before` is the cursor returned by the previous page (a created_at score);
+    only tasks created strictly before it are returned. `filters` is an
+    optional {'status': ..., 'workflow_type': ...} dict answered from the
+    secondary indexes. With `include_archive` (and a `limit`), the page is
+    merged with archived tasks from Postgres, which share the same cursor, so
+    paging continues past the hot set into the history. Returns a tuple of
+    (tasks, next_before) where next_before is None on the last page.
+    """
     redis_conn = current_app.redis_conn
     if not redis_conn:
-        print("Warning: Redis connection not available in get_all_tasks.")
-        return []
+        print("Warning: Redis connection not available in get_tasks_page.")
+        return [], None
 
-    tasks = []
-    task_ids_from_list = []
+    max_score = '+inf' if before is None else f"({float(before)!r}"
     try:
-        # Get the list of active task IDs from Redis
-        task_ids_from_list = redis_conn.lrange("active_tasks", 0, -1)
-        if not task_ids_from_list:
-            print("No active tasks found in Redis list 'active_tasks'.")
-            return [] # Return empty list if no IDs are found
+        index_key, conditions = _filter_index_and_conditions(redis_conn, filters)
+        rows = redis_conn.register_script(_LIST_TASKS_LUA)(
+            keys=[index_key], args=[max_score, limit or 0, *conditions]
+        )
     except Exception as e:
-        print(f"Error reading 'active_tasks' list from Redis: {e}")
-        return [] # Return empty on error
+        print(f"Error reading task index from Redis: {e}")
+        return [], None # Return empty on error
 
-    print(f"Found active task IDs in Redis list: {task_ids_from_list}") # Debugging line
+    entries = []
+    for task_id, flat_fields, finish_state_json, score in rows:
+        # HGETALL comes back from Lua as a flat [field, value, ...] list
+        task_info = dict(zip(flat_fields[::2], flat_fields[1::2]))
+        if task_id.startswith('workflow_'):
+            _apply_workflow_finish(task_id, task_info, finish_state_json)
+        entries.append((task_info, float(score)))
 
-    unique_task_ids = set(task_ids_from_list)
-    print(f'Memproses {len(unique_task_ids)} unique task IDs from Redis list.') # Debugging line
+    if include_archive and limit:
+        # A task sits in both tiers only between its archive commit and its
+        # eviction; the Redis copy wins.
+        hot_ids = {task_info.get('task_id') for task_info, _ in entries}
+        entries += [
+            (task_info, score) for task_info, score in get_archived_tasks_page(limit, before, filters)
+            if task_info.get('task_id') not in hot_ids
+        ]
+        entries.sort(key=lambda entry: entry[1], reverse=True)
+        entries = entries[:limit]
 
-    for task_id in unique_task_ids:
-        task_info = {}
-        try:
-            # Fetch the details for each task ID
-            task_info = redis_conn.hgetall(f"task:{task_id}")
-        except Exception as e:
-            print(f"Error fetching details for task '{task_id}' from Redis: {e}")
-            continue # Skip this task if details can't be fetched
+    next_before = None
+    if limit and len(entries) >= limit:
+        next_before = entries[-1][1]
+    return [task_info for task_info, _ in entries], next_before
 
-        if not task_info:
-            # This can happen if the task info expired or was manually deleted
-            print(f"Warning: No task details found in Redis hash for task ID '{task_id}' (from active_tasks list). Skipping.")
-            continue
 
-        print(f"Processing task details for ID '{task_id}': {task_info}") # Debugging line
+def get_tasks_version():
+    """Current task-store version, or None when Redis is unavailable."""
+    redis_conn = current_app.redis_conn
+    if not redis_conn:
+        return None
+    return redis_conn.get(TASKS_VERSION_KEY) or '0'
 
-        # --- START FIX: Process ALL tasks, but apply special logic for workflows ---
 
-        # Keep the logic to update status based on workflow finish state
-        if task_id.startswith('workflow_'):
-            finish_state_json = None
-            try:
-                finish_state_json = redis_conn.hget(f"workflow_state:{task_id}", "workflow_finish")
-            except Exception as e:
-                 print(f"Error fetching workflow_finish state for task '{task_id}': {e}")
-
-            if finish_state_json:
-                try:
-                    finish_state = json.loads(finish_state_json)
-                    # Use the status from workflow_finish if it's success or fail
-                    if finish_state.get('status') in ['success', 'fail']:
-                        # Map 'success'/'fail' from workflow state to 'SUCCESS'/'FAILURE'
-                        task_info['status'] = "SUCCESS" if finish_state['status'] == 'success' else "FAILURE"
-                        task_info['last_message'] = finish_state.get('message', task_info.get('last_message', '')) # Use existing message as fallback
-                        print(f"Updated task '{task_id}' status from workflow_finish state.") # Debugging line
-                except json.JSONDecodeError:
-                    print(f"Warning: Could not decode workflow_finish JSON for task {task_id}")
-                except Exception as e:
-                    print(f"Error processing workflow_finish state for task '{task_id}': {e}")
-
-
-        # Append ALL valid task_info objects retrieved from Redis hashes
-        tasks.append(task_info)
-        # --- END FIX ---
-
-    print(f"Returning {len(tasks)} tasks to be displayed.") # Debugging line
+def get_all_tasks(filters=None):
+    """Get all active tasks, newest first."""
+    tasks, _ = get_tasks_page(filters=filters)
     return tasks
 
 
@@ -92,14 +402,112 @@ def store_task_info(task_id, task_name, filename, created_at, status='PENDING',
         # Add workflow_type to the stored data if provided
         if workflow_type:
             task_info['workflow_type'] = workflow_type
-            
-        redis_conn.hset(f"task:{task_id}", mapping=task_info)
-        redis_conn.lpush("active_tasks", task_id)
-        redis_conn.expire(f"task:{task_id}", 86400)  # 24 hours
+
+        args = [task_id, _created_score(created_at), TASK_TTL_SECONDS]
+        for key, value in task_info.items():
+            args += [key, value]
+        created, version = redis_conn.register_script(_STORE_TASK_LUA)(
+            keys=[f"task:{task_id}", TASK_INDEX_KEY], args=args
+        )
+        _emit_task_delta('created' if created else 'updated', dict(task_info, version=version))
 
 
-def remove_task_from_list(task_id):
-    """Remove task from active list"""
+def transition_task(task_id, status=None, last_message=None, at=None, expected_version=None, workflow_finish=None):
+    """
+    Apply one state transition to an existing task as a single atomic write:
+    status and/or last message, a fresh TTL, a bumped version and the index
+    moves, in one round-trip.
+
+    `at` is the event time (epoch milliseconds) for callers replaying events;
+    an event older than the last applied write is refused. `expected_version`
+    turns the write into a compare-and-set. A task in a terminal status never
+    moves to another status. `workflow_finish` ({'status', 'message'}) is
+    stored in workflow_state:<id> by the same write, only when it is applied.
+    Returns the new version, or None when the transition was refused or the
+    task does not exist.
+    """
+    redis_conn = current_app.redis_conn
+    if not redis_conn:
+        return None
+    applied, version, current_status = redis_conn.register_script(_TRANSITION_TASK_LUA)(
+        keys=[f"task:{task_id}", TASK_INDEX_KEY, f"workflow_state:{task_id}"],
+        args=[
+            task_id, status or '', '0' if last_message is None else '1', last_message or '',
+            TASK_TTL_SECONDS, '' if at is None else int(at),
+            '' if expected_version is None else int(expected_version),
+            json.dumps(workflow_finish) if workflow_finish else '',
+            *TERMINAL_TASK_STATUSES,
+        ],
+    )
+    if not applied:
+        if current_status is None:
+            print(f"Warning: Cannot update status of unknown task '{task_id}'.")
+        else:
+            print(f"Skipped stale transition of task '{task_id}' (currently '{current_status}', v{version}).")
+        return None
+
+    delta = {'task_id': task_id, 'version': version}
+    if status:
+        delta['status'] = status
+    if last_message is not None:
+        delta['last_message'] = last_message
+    _emit_task_delta('updated', delta)
+    return version
+
+
+def delete_task(task_id):
+    """Delete a task's hash and remove it from every task index."""
     redis_conn = current_app.redis_conn
     if redis_conn:
-        redis_conn.lrem("active_tasks", 0, task_id)
\ No newline at end of file
+        redis_conn.register_script(_REMOVE_TASK_LUA)(
+            keys=[f"task:{task_id}", TASK_INDEX_KEY], args=[task_id]
+        )
+        _emit_task_delta('removed', {'task_id': task_id})
+
+
+def evict_archived_task(task_id, version):
+    """
+    Drop an archived task, its workflow timeline and its summary result from
+    Redis, unless it was written to after being archived. Returns True when
+    it was evicted.
+    """
+    redis_conn = current_app.redis_conn
+    if not redis_conn:
+        return False
+    return bool(redis_conn.register_script(_EVICT_TASK_LUA)(
+        keys=[
+            f"task:{task_id}", TASK_INDEX_KEY, f"workflow_state:{task_id}", f"summary_result:{task_id}",
+            f"workflow_log:{task_id}", f"workflow_timing:{task_id}", "summary_history:expiry",
+        ],
+        args=[task_id, version],
+    ))
+
+
+def migrate_legacy_task_list(redis_conn):
+    """
+    Move task IDs from the old 'active_tasks' list into the sorted-set indexes.
+    Safe to call on every start-up; it is a single EXISTS when nothing is left.
+    """
+    if not redis_conn or not redis_conn.exists(LEGACY_TASK_LIST_KEY):
+        return
+    task_ids = list(set(redis_conn.lrange(LEGACY_TASK_LIST_KEY, 0, -1)))
+    pipe = redis_conn.pipeline()
+    for task_id in task_ids:
+        pipe.hmget(f"task:{task_id}", "created_at", *INDEXED_TASK_FIELDS)
+    stored = pipe.execute()
+
+    migrated = 0
+    pipe = redis_conn.pipeline()
+    for task_id, (created_at, *indexed_values) in zip(task_ids, stored):
+        if not created_at:
+            continue # task:<id> already expired
+        score = _created_score(created_at)
+        pipe.zadd(TASK_INDEX_KEY, {task_id: score}, nx=True)
+        for field, value in zip(INDEXED_TASK_FIELDS, indexed_values):
+            if value:
+                pipe.zadd(task_field_index_key(field, value), {task_id: score}, nx=True)
+        migrated += 1
+    pipe.delete(LEGACY_TASK_LIST_KEY)
+    pipe.incr(TASKS_VERSION_KEY)
+    pipe.execute()
+    print(f"Migrated {migrated} tasks from '{LEGACY_TASK_LIST_KEY}' into '{TASK_INDEX_KEY}'.")
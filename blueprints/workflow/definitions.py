@@ -0,0 +1,58 @@
+# blueprints/workflow/definitions.py
+from collections import namedtuple
+from flask import current_app
+
+# One step of a compiled workflow definition. `position` is 1-based, and
+# `predecessor` is the step expected to have reported before this one (None
+# for the first step).
+StepInfo = namedtuple('StepInfo', ['workflow_type', 'step_id', 'position', 'total', 'is_final', 'predecessor'])
+
+
+def compile_workflows(workflows):
+    """
+    Compile Config.WORKFLOWS into {workflow_type: {step_id: StepInfo}} so a
+    step callback resolves with two dict lookups. Steps whose ID is not
+    configured (env var unset) are left out.
+    """
+    index = {}
+    for workflow_type, definition in workflows.items():
+        step_ids = [step.get('id') for step in definition.get('steps', [])]
+        if None in step_ids or '' in step_ids:
+            print(f"Warning: Workflow '{workflow_type}' has steps without an ID; they are ignored.")
+        step_ids = [step_id for step_id in step_ids if step_id]
+        total = len(step_ids)
+        index[workflow_type] = {
+            step_id: StepInfo(
+                workflow_type, step_id, position, total, position == total,
+                step_ids[position - 2] if position > 1 else None,
+            )
+            for position, step_id in enumerate(step_ids, start=1)
+        }
+    return index
+
+
+def get_workflow_index():
+    """The compiled workflow index of the current app, compiled on first use."""
+    index = getattr(current_app, 'workflow_index', None)
+    if index is None:
+        index = current_app.workflow_index = compile_workflows(current_app.config['WORKFLOWS'])
+    return index
+
+
+def resolve_step(workflow_type, step_id):
+    """StepInfo for a callback, or raise ValueError for an unknown workflow or step."""
+    steps = get_workflow_index().get(workflow_type)
+    if steps is None:
+        raise ValueError(f"Unknown workflow_type '{workflow_type}'")
+    step = steps.get(step_id)
+    if step is None:
+        raise ValueError(f"Unknown step_id '{step_id}' for workflow_type '{workflow_type}'")
+    return step
+
+
+def step_progress(step, status):
+    """Percentage of the workflow done once `step` reports `status`."""
+    if not step.total:
+        return 0
+    completed = step.position if status == 'success' else step.position - 1
+    return round(completed * 100 / step.total)
@@ -0,0 +1,171 @@
+# blueprints/workflow/metrics.py
+from flask import current_app
+from .definitions import get_workflow_index
+
+# Upper bounds (ms) of the latency histogram buckets; anything slower lands in +Inf
+LATENCY_BUCKETS_MS = (100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000, 120000, 300000, 600000, 1800000)
+
+# workflow_timing:<task_id> holds the timeline of one run:
+#   started_at_ms            task creation time (or the first callback)
+#   <step>:first_ms          first callback of a step (e.g. 'running')
+#   <step>:done_ms           the step's success/fail callback
+#   <step>:duration_ms       done_ms minus the step's start
+#   total_ms                 end-to-end duration, once the workflow finished
+# workflow_metrics:<type>:step:<step_id> and workflow_metrics:<type>:total are
+# histograms: le_<bound> bucket counts plus count, sum_ms and max_ms.
+
+
+def workflow_timing_key(task_id):
+    return f"workflow_timing:{task_id}"
+
+
+def step_histogram_key(workflow_type, step_id):
+    return f"workflow_metrics:{workflow_type}:step:{step_id}"
+
+
+def total_histogram_key(workflow_type):
+    return f"workflow_metrics:{workflow_type}:total"
+
+
+# Records the timing of one step callback and feeds the histograms.
+# A step starts at its first callback; when 'success' is the first thing it
+# reports, it started when its predecessor finished (or the run started).
+# Only the first success/fail of a step is timed, so retried callbacks do not
+# count twice. Only successful steps and runs go into the histograms.
+# KEYS[1] = workflow_timing:<id>, KEYS[2] = task:<id>,
+# KEYS[3] = step histogram, KEYS[4] = total histogram
+# ARGV[1] = step id, ARGV[2] = predecessor step id (''), ARGV[3] = status,
+# ARGV[4] = received-at ms, ARGV[5] = finish status ('' while running),
+# ARGV[6] = TTL, ARGV[7..] = bucket bounds
+# Returns {step duration ms, total ms}, -1 where not known yet.
+RECORD_STEP_TIMING_LUA = """
+local function observe(key, value)
+    local bucket = '+Inf'
+    for i = 7, #ARGV do
+        if value <= tonumber(ARGV[i]) then
+            bucket = ARGV[i]
+            break
+        end
+    end
+    redis.call('HINCRBY', key, 'le_' .. bucket, 1)
+    redis.call('HINCRBY', key, 'count', 1)
+    redis.call('HINCRBY', key, 'sum_ms', value)
+    if value > (tonumber(redis.call('HGET', key, 'max_ms')) or 0) then
+        redis.call('HSET', key, 'max_ms', value)
+    end
+end
+
+local at = math.floor(tonumber(ARGV[4]))
+local started = tonumber(redis.call('HGET', KEYS[1], 'started_at_ms'))
+if not started then
+    started = math.floor(tonumber(redis.call('HGET', KEYS[2], 'created_at_ms')) or at)
+    redis.call('HSET', KEYS[1], 'started_at_ms', started)
+end
+
+local step = ARGV[1]
+redis.call('HSETNX', KEYS[1], step .. ':first_ms', at)
+local step_ms, total_ms = -1, -1
+if (ARGV[3] == 'success' or ARGV[3] == 'fail') and redis.call('HSETNX', KEYS[1], step .. ':done_ms', at) == 1 then
+    local start = tonumber(redis.call('HGET', KEYS[1], step .. ':first_ms'))
+    if start == at then
+        start = started
+        if ARGV[2] ~= '' then
+            start = tonumber(redis.call('HGET', KEYS[1], ARGV[2] .. ':done_ms')) or start
+        end
+    end
+    step_ms = math.max(at - start, 0)
+    redis.call('HSET', KEYS[1], step .. ':duration_ms', step_ms)
+    if ARGV[3] == 'success' then
+        observe(KEYS[3], step_ms)
+    end
+end
+if ARGV[5] ~= '' and redis.call('HSETNX', KEYS[1], 'total_ms', math.max(at - started, 0)) == 1 then
+    total_ms = math.max(at - started, 0)
+    if ARGV[5] == 'success' then
+        observe(KEYS[4], total_ms)
+    else
+        redis.call('HINCRBY', KEYS[4], 'failed', 1)
+    end
+end
+redis.call('EXPIRE', KEYS[1], ARGV[6])
+return {step_ms, total_ms}
+"""
+
+
+def queue_step_timing(pipe, update, received_at_ms, ttl):
+    """Add the timing script for one step update to `pipe`."""
+    script = current_app.redis_conn.register_script(RECORD_STEP_TIMING_LUA)
+    script(
+        keys=[
+            workflow_timing_key(update['task_id']), f"task:{update['task_id']}",
+            step_histogram_key(update['workflow_type'], update['step_id']), total_histogram_key(update['workflow_type']),
+        ],
+        args=[
+            update['step_id'], update['step'].predecessor or '', update['status'], received_at_ms,
+            update['finish']['status'] if update['finish'] else '', ttl, *LATENCY_BUCKETS_MS,
+        ],
+        client=pipe,
+    )
+
+
+def step_timings(timing):
+    """{step_id: duration_ms} from a workflow_timing hash, plus 'workflow_finish' for the total."""
+    durations = {
+        field[:-len(':duration_ms')]: int(value)
+        for field, value in timing.items() if field.endswith(':duration_ms')
+    }
+    if 'total_ms' in timing:
+        durations['workflow_finish'] = int(timing['total_ms'])
+    return durations
+
+
+def summarize_histogram(histogram):
+    """Count, average, max and bucket-estimated p50/p95 of a latency histogram hash."""
+    count = int(histogram.get('count', 0))
+    buckets = {str(bound): int(histogram.get(f'le_{bound}', 0)) for bound in LATENCY_BUCKETS_MS}
+    buckets['+Inf'] = int(histogram.get('le_+Inf', 0))
+    summary = {
+        'count': count,
+        'avg_ms': round(int(histogram.get('sum_ms', 0)) / count) if count else None,
+        'max_ms': int(histogram['max_ms']) if 'max_ms' in histogram else None,
+        'p50_ms': None,
+        'p95_ms': None,
+        'buckets': buckets,
+    }
+    if 'failed' in histogram:
+        summary['failed'] = int(histogram['failed'])
+    for name, quantile in (('p50_ms', 0.5), ('p95_ms', 0.95)):
+        if not count:
+            continue
+        seen = 0
+        for bound, bucket_count in buckets.items():
+            seen += bucket_count
+            if seen >= quantile * count:
+                # The bucket's upper bound, capped by the slowest value seen
+                summary[name] = summary['max_ms'] if bound == '+Inf' else min(int(bound), summary['max_ms'])
+                break
+    return summary
+
+
+def get_workflow_metrics(workflow_type):
+    """Latency summary of every step of a workflow type, in step order, plus end-to-end."""
+    steps = get_workflow_index().get(workflow_type)
+    if steps is None:
+        return None
+    names = {
+        step.get('id'): step.get('name') or step.get('title')
+        for step in current_app.config['WORKFLOWS'][workflow_type].get('steps', [])
+    }
+    pipe = current_app.redis_conn.pipeline(transaction=False)
+    for step_id in steps:
+        pipe.hgetall(step_histogram_key(workflow_type, step_id))
+    pipe.hgetall(total_histogram_key(workflow_type))
+    histograms = pipe.execute()
+    return {
+        'workflow_type': workflow_type,
+        'steps': [
+            dict(summarize_histogram(histogram), step_id=step.step_id, name=names.get(step.step_id), position=step.position)
+            for step, histogram in zip(steps.values(), histograms)
+        ],
+        'total': summarize_histogram(histograms[-1]),
+    }
@@ -1,14 +1,22 @@
 # blueprints/workflow/routes.py
 from flask import Blueprint, render_template, request, jsonify, current_app, abort
 from app import socketio
-from ..tasks.utils import store_task_info
-from ..api.utils import update_app_status_via_api
+from ..tasks.archive import get_archived_workflow_state
+from .utils import (
+    apply_step_updates, enqueue_step_updates, get_step_event_metrics, get_workflow_snapshot, ingest_step_updates,
+    replay_step_events, IngestBacklogFull,
+)
+from .metrics import get_workflow_metrics
 from datetime import datetime
 from dateutil import tz
 import json
+import re
 
 workflow_bp = Blueprint('workflow', __name__, template_folder='../../templates')
 
+MAX_BATCH_STEP_UPDATES = 500
+STREAM_ID_PATTERN = re.compile(r'\d+-\d+')
+
 @workflow_bp.route('/workflow/<workflow_type>/<task_id>')
 def timeline(workflow_type, task_id):
     """Renders the real-time workflow timeline page for a specific task and workflow."""
@@ -18,8 +26,11 @@ def timeline(workflow_type, task_id):
 
     redis_conn = current_app.redis_conn
     workflow_state = {}
+    step_timings = {}
+    last_event_id = None
     if redis_conn:
-        state_data = redis_conn.hgetall(f'workflow_state:{task_id}')
+        # The timeline resumes the live event log right after this snapshot
+        state_data, step_timings, last_event_id = get_workflow_snapshot(task_id)
         for step_id, step_data_json in state_data.items():
             # --- FIX: Add error handling for invalid JSON ---
             try:
@@ -29,13 +40,19 @@ def timeline(workflow_type, task_id):
                 # Optionally set a default error state or skip
                 workflow_state[step_id] = {'status': 'fail', 'message': 'Error loading state'}
             # --- END FIX ---
+    if not workflow_state:
+        # Finished workflows are moved to the task archive after a while
+        workflow_state = get_archived_workflow_state(task_id)
 
     return render_template(
         'workflow_timeline.html',
         task_id=task_id,
+        workflow_type=workflow_type,
         workflow_title=workflow_definition['title'],
         steps=workflow_definition['steps'],
-        workflow_state=workflow_state
+        workflow_state=workflow_state,
+        step_timings=step_timings,
+        last_event_id=last_event_id
     )
 
 @workflow_bp.route('/workflow/debug')
@@ -47,115 +64,132 @@ def workflow_debug():
 def workflow_webhook():
     """
     This is the webhook endpoint that n8n will call to post status updates.
-    It receives a status update and broadcasts it to the correct client via WebSockets.
+    The update is validated and queued on the step-event stream, and 202 is
+    returned at once; workflow_consumer.py applies it and broadcasts it to the
+    correct client via WebSockets. With WORKFLOW_EVENTS_ASYNC off it is
+    applied within the request as before.
     """
     data = request.get_json()
     if not data:
         return jsonify({"error": "Invalid JSON"}), 400
 
-    task_id = data.get('flask_task_id') or data.get('task_id') # Prioritize flask_task_id
-    step_id = data.get('step_id')
-    status = data.get('status')
-    message = data.get('message')
-    workflow_type = data.get('workflow_type')
-
     # --- Add Logging ---
     print("\n--- Webhook Received ---")
     print(f"Timestamp: {datetime.now(tz.gettz('Asia/Jakarta')).isoformat()}")
-    print(f"Task ID (from payload): {task_id}")
-    print(f"Step ID: {step_id}")
-    print(f"Status: {status}")
-    print(f"Workflow Type: {workflow_type}")
-    print(f"Message: {message}")
     # --- End Logging ---
 
-    if not all([task_id, step_id, status, workflow_type]):
-        print("Webhook Error: Missing required fields") # Add Logging
-        return jsonify({"error": "Missing required fields: task_id (or flask_task_id), step_id, status, workflow_type"}), 400
-
-    redis_conn = current_app.redis_conn
-    if redis_conn:
-        step_state = {'status': status, 'message': message}
+    # n8n retries a failed HTTP node with the same payload; a retry is answered without side effects
+    idempotency_key = request.headers.get('Idempotency-Key')
+    if _ingest_async():
+        # Queue the event for the consumer group and answer right away
         try:
-            redis_conn.hset(f'workflow_state:{task_id}', step_id, json.dumps(step_state))
-            redis_conn.expire(f'workflow_state:{task_id}', 604800) # Expire in 7 days
-            print(f"Saved state for step '{step_id}' to Redis key 'workflow_state:{task_id}'.") # Add Logging
-        except Exception as e:
-            print(f"ERROR saving step state to Redis: {e}") # Add Logging for Redis errors
-
-    # Broadcast update via SocketIO
-    print(f"Broadcasting SocketIO 'status_update' for step '{step_id}' to room '{task_id}'.") # Add Logging
-    socketio.emit('status_update', {
-        'step_id': step_id,
-        'status': status,
-        'message': message,
-        'workflow_type': workflow_type,
-    }, room=task_id)
-
-    # Check if this is the final step
-    workflow_definition = current_app.config['WORKFLOWS'].get(workflow_type)
-    final_step_id = None # Initialize
-    if workflow_definition and 'steps' in workflow_definition and workflow_definition['steps']:
-        final_step_id = workflow_definition['steps'][-1]['id']
-        print(f"Checking against final step ID from config: '{final_step_id}'") # Add Logging
-    else:
-        print(f"Warning: No steps found in config for workflow_type '{workflow_type}'") # Add Logging
-
-    final_workflow_status = None
-    final_workflow_message = ""
-    global_status_message = ""
-
-    if status == 'fail':
-        print(f"Workflow '{workflow_type}' failed at step '{step_id}'.") # Add Logging
-        final_workflow_status = 'fail'
-        final_workflow_message = f"Workflow gagal pada langkah: {step_id}. Pesan: {message}"
-        global_status_message = f"❌ Workflow '{workflow_type}' Gagal ({task_id})"
-
-    # --- Ensure final_step_id is not None before comparing ---
-    elif final_step_id is not None and step_id == final_step_id and status == "success":
-        print(f"SUCCESS: Final step condition met for step '{step_id}'.") # Add Logging
-        final_workflow_status = 'success'
-        final_workflow_message = "Semua langkah berhasil diselesaikan."
-        global_status_message = f"✅ Workflow '{workflow_type}' Selesai ({task_id})"
-    # --- End Check ---
-    elif status == "success":
-         print(f"Step '{step_id}' succeeded, but it's not the final step ('{final_step_id}').") # Add Logging
-    else:
-         print(f"Step '{step_id}' has status '{status}', not checking final step condition.") # Add Logging
-
-
-    if final_workflow_status:
-        print(f"Attempting to save final workflow status '{final_workflow_status}' to Redis.") # Add Logging
-        if redis_conn:
-            finish_step_state = {'status': final_workflow_status, 'message': final_workflow_message}
-            try:
-                # Save 'workflow_finish' state
-                redis_conn.hset(f'workflow_state:{task_id}', 'workflow_finish', json.dumps(finish_step_state))
-                print(f"Saved 'workflow_finish' state to Redis key 'workflow_state:{task_id}'.") # Add Logging
-
-                # Update main task status (for /tasks page)
-                task_page_status = "SUCCESS" if final_workflow_status == 'success' else "FAILURE"
-                redis_conn.hset(f"task:{task_id}", "status", task_page_status)
-                redis_conn.hset(f"task:{task_id}", "last_message", final_workflow_message)
-                print(f"Updated main task status in Redis key 'task:{task_id}' to '{task_page_status}'.") # Add Logging
-
-            except Exception as e:
-                print(f"ERROR saving final workflow state to Redis: {e}") # Add Logging for Redis errors
+            result = ingest_step_updates([data], enqueue_step_updates, idempotency_key)[0]
+        except IngestBacklogFull as e:
+            return _backlog_full_response(e)
+        if result['status'] == 'error':
+            return jsonify({"error": result['error']}), 400
+        if result['status'] == 'duplicate':
+            return jsonify({"status": "duplicate"}), 200
+        return jsonify({"status": "queued", "event_id": result['event_id']}), 202
+
+    result = ingest_step_updates([data], apply_step_updates, idempotency_key)[0]
+    if result['status'] == 'duplicate':
+        return jsonify({"status": "duplicate"}), 200
+    if result['status'] == 'error':
+        return jsonify({"error": result['error']}), 400
+    return jsonify({"status": "received"}), 200
 
-        if global_status_message:
-            update_app_status_via_api(global_status_message)
 
-    return jsonify({"status": "received"}), 200
+@workflow_bp.route('/api/workflow/update/batch', methods=['POST'])
+def workflow_webhook_batch():
+    """
+    Batch variant of /api/workflow/update for n8n. Accepts a JSON array of
+    step updates (or {"updates": [...]}) for one or many tasks and queues
+    them in one pipelined write (or applies them, with WORKFLOW_EVENTS_ASYNC
+    off). Items already delivered recently are skipped. Each item is answered separately:
+    {"results": [{"index", "status": "queued"|"received"|"duplicate"|"error", ...}], "received", "rejected", "duplicates"}.
+    """
+    data = request.get_json(silent=True)
+    updates = data.get('updates') if isinstance(data, dict) else data
+    if not isinstance(updates, list) or not updates:
+        return jsonify({"error": "Expected a non-empty JSON array of step updates (or {\"updates\": [...]})"}), 400
+    if len(updates) > MAX_BATCH_STEP_UPDATES:
+        return jsonify({"error": f"At most {MAX_BATCH_STEP_UPDATES} step updates per batch"}), 413
+
+    print(f"\n--- Batch Webhook Received: {len(updates)} update(s) ---")
+    if _ingest_async():
+        try:
+            results = ingest_step_updates(updates, enqueue_step_updates)
+        except IngestBacklogFull as e:
+            return _backlog_full_response(e)
+        status_code = 202
+    else:
+        results = ingest_step_updates(updates, apply_step_updates)
+        status_code = 200
+    rejected = sum(1 for result in results if result['status'] == 'error')
+    duplicates = sum(1 for result in results if result['status'] == 'duplicate')
+    return jsonify({
+        "results": results, "received": len(results) - rejected - duplicates, "rejected": rejected, "duplicates": duplicates,
+    }), status_code
+
+
+@workflow_bp.route('/api/workflow/ingest/metrics', methods=['GET'])
+def workflow_ingest_metrics():
+    """Depth, pending events, consumers and counters of the step-event queue."""
+    if not current_app.redis_conn:
+        return jsonify({"error": "redis connection failed"}), 503
+    return jsonify(get_step_event_metrics())
+
+
+@workflow_bp.route('/api/workflow/<workflow_type>/metrics', methods=['GET'])
+def workflow_latency_metrics(workflow_type):
+    """Per-step and end-to-end latency histograms (count, avg, p50, p95, max) of a workflow type."""
+    if not current_app.redis_conn:
+        return jsonify({"error": "redis connection failed"}), 503
+    metrics = get_workflow_metrics(workflow_type)
+    if metrics is None:
+        return jsonify({"error": f"Unknown workflow_type '{workflow_type}'"}), 404
+    return jsonify(metrics)
+
+
+def _ingest_async():
+    """Whether step callbacks are queued for the consumer instead of applied in the request."""
+    return current_app.config['WORKFLOW_EVENTS_ASYNC'] and current_app.redis_conn is not None
+
+
+def _backlog_full_response(error):
+    print(f"Webhook Error: {error}")
+    response = jsonify({"error": str(error)})
+    response.status_code = 503
+    response.headers['Retry-After'] = '5'
+    return response
 
 # --- WebSocket Event Handlers ---
 @socketio.on('join')
 def on_join(data):
-    """Allows a client to join a room for a specific task."""
-    from flask_socketio import join_room
+    """
+    Allows a client to join a room for a specific task. A timeline client
+    passes the last event_id it has seen as `last_event_id`; the step events
+    logged after it are sent back to that client only, as one replay frame.
+    """
+    from flask_socketio import join_room, emit
     task_id = data['room']
     join_room(task_id)
     print(f"Client joined room: {task_id}")
 
+    # Joined first, so nothing falls between the replay and the live events;
+    # the client skips anything it receives twice by event_id.
+    last_event_id = data.get('last_event_id')
+    if last_event_id and STREAM_ID_PATTERN.fullmatch(str(last_event_id)) and current_app.redis_conn:
+        events = replay_step_events(task_id, last_event_id)
+        if events:
+            emit('event_batch', {
+                'events': [{'event': 'status_update', 'data': event} for event in events],
+                'collapsed': 0,
+                'replay': True,
+            })
+            print(f"Replayed {len(events)} step event(s) to client in room: {task_id}")
+
 @socketio.on('leave')
 def on_leave(data):
     """Allows a client to leave a room."""
@@ -0,0 +1,479 @@
+# blueprints/workflow/utils.py
+import json
+import time
+import redis
+from flask import current_app
+from app import emitter
+from ..tasks.utils import transition_task
+from ..api.utils import update_app_status_via_api, delivery_id, claim_deliveries, release_deliveries
+from .definitions import resolve_step, step_progress
+from .metrics import queue_step_timing, step_timings, workflow_timing_key
+
+WORKFLOW_STATE_TTL_SECONDS = 604800 # workflow_state:<id> hashes live for 7 days
+REQUIRED_STEP_FIELDS = ('task_id', 'step_id', 'status', 'workflow_type')
+
+# Step callbacks are queued on this stream by the webhook and applied by the
+# consumer group (see workflow_consumer.py). The backlog is read from the
+# group itself (XINFO GROUPS): events not delivered yet (lag) plus events
+# delivered but not acknowledged (pending).
+STEP_EVENTS_STREAM = "workflow_events"
+STEP_EVENTS_GROUP = "workflow_event_consumers"
+STEP_EVENTS_STATS_KEY = f"{STEP_EVENTS_STREAM}:stats"
+
+
+# Every applied step update is also appended to workflow_log:<task_id>, an
+# ordered log whose stream IDs are sent along as event_id. A timeline client
+# that reconnects passes the last event_id it saw to `join` and is sent only
+# the events after it (see replay_step_events).
+WORKFLOW_LOG_MAXLEN = 500 # approximate number of step events kept per task
+REPLAY_LIMIT = 1000
+
+
+def workflow_log_key(task_id):
+    return f"workflow_log:{task_id}"
+
+
+class IngestBacklogFull(Exception):
+    """The step-event queue is over WORKFLOW_EVENTS_MAX_BACKLOG; the caller should retry later."""
+
+
+def _parse_step_update(data):
+    """
+    Normalise one n8n step callback into a dict, resolving its step in the
+    compiled workflow index. Raises ValueError for a malformed callback or an
+    unknown workflow/step, before anything is written.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Step update must be a JSON object")
+    update = {
+        'task_id': data.get('flask_task_id') or data.get('task_id'), # Prioritize flask_task_id
+        'step_id': data.get('step_id'),
+        'status': data.get('status'),
+        'message': data.get('message'),
+        'workflow_type': data.get('workflow_type'),
+    }
+    missing = [field for field in REQUIRED_STEP_FIELDS if not update[field]]
+    if missing:
+        raise ValueError(f"Missing required fields: {', '.join(missing)}")
+    update['step'] = resolve_step(update['workflow_type'], update['step_id'])
+    return update
+
+
+def _finish_state(update):
+    """
+    The workflow_finish state and global status message this update leads to,
+    or (None, None) when the workflow is still running.
+    """
+    workflow_type, task_id, step_id = update['workflow_type'], update['task_id'], update['step_id']
+    if update['status'] == 'fail':
+        print(f"Workflow '{workflow_type}' failed at step '{step_id}'.")
+        return (
+            {'status': 'fail', 'message': f"Workflow gagal pada langkah: {step_id}. Pesan: {update['message']}"},
+            f"❌ Workflow '{workflow_type}' Gagal ({task_id})",
+        )
+    if update['status'] == 'success' and update['step'].is_final:
+        print(f"SUCCESS: Final step condition met for step '{step_id}'.")
+        return (
+            {'status': 'success', 'message': "Semua langkah berhasil diselesaikan."},
+            f"✅ Workflow '{workflow_type}' Selesai ({task_id})",
+        )
+    return None, None
+
+
+def _flag_out_of_order(redis_conn, updates):
+    """
+    Mark updates whose predecessor step has not reported yet, neither earlier
+    in this batch nor in workflow_state:<id>. One pipelined read per batch.
+    """
+    seen = set()
+    unresolved = []
+    for update in updates:
+        predecessor = update['step'].predecessor
+        update['out_of_order'] = False
+        if predecessor and (update['task_id'], predecessor) not in seen:
+            unresolved.append(update)
+        seen.add((update['task_id'], update['step_id']))
+    if not unresolved or not redis_conn:
+        return
+    pipe = redis_conn.pipeline(transaction=False)
+    for update in unresolved:
+        pipe.hexists(f"workflow_state:{update['task_id']}", update['step'].predecessor)
+    for update, reported in zip(unresolved, pipe.execute()):
+        if not reported:
+            update['out_of_order'] = True
+            print(f"Warning: Step '{update['step_id']}' of task '{update['task_id']}' arrived before step '{update['step'].predecessor}'.")
+
+
+def apply_step_updates(items, received_at_ms=None):
+    """
+    Apply a list of n8n step callbacks, for one or many tasks.
+
+    Every valid update is written to its workflow_state:<id> hash in a single
+    pipelined round-trip (one EXPIRE per task), timed, broadcast to the
+    task's room, and, when it finishes its workflow, moves the task to
+    SUCCESS/FAILURE. The broadcasts go through the coalescing emitter, so
+    each room receives the batch as one frame. `received_at_ms` lists when
+    each item reached the webhook (defaults to now). Returns one result dict
+    per item, in order. Raises when the updates could not be saved, so they
+    are retried (the webhook answers 500, the consumer leaves them pending).
+    """
+    now_ms = int(time.time() * 1000)
+    results = []
+    accepted = []
+    for index, data in enumerate(items):
+        try:
+            update = _parse_step_update(data)
+        except ValueError as e:
+            print(f"Webhook Error: {e}")
+            results.append({'index': index, 'status': 'error', 'error': str(e)})
+            continue
+        print(f"Step update for task '{update['task_id']}': step '{update['step_id']}' -> '{update['status']}' ({update['workflow_type']})")
+        update['finish'], update['global_status'] = _finish_state(update)
+        update['received_at_ms'] = int(received_at_ms[index]) if received_at_ms else now_ms
+        update['result'] = {'index': index, 'status': 'received', 'task_id': update['task_id'], 'step_id': update['step_id']}
+        accepted.append(update)
+        results.append(update['result'])
+
+    redis_conn = current_app.redis_conn
+    _flag_out_of_order(redis_conn, accepted)
+    for update in accepted:
+        update['result']['out_of_order'] = update['out_of_order']
+    if redis_conn and accepted:
+        # Step states and their TTLs go out in one round-trip; workflow_finish is
+        # written by the guarded task transition below
+        try:
+            pipe = redis_conn.pipeline()
+            log_positions = []
+            timing_positions = []
+            for update in accepted:
+                state_key = f"workflow_state:{update['task_id']}"
+                pipe.hset(state_key, update['step_id'], json.dumps({
+                    'status': update['status'], 'message': update['message'], 'received_at_ms': update['received_at_ms'],
+                }))
+                timing_positions.append(len(pipe))
+                queue_step_timing(pipe, update, update['received_at_ms'], WORKFLOW_STATE_TTL_SECONDS)
+                log_positions.append(len(pipe))
+                pipe.xadd(workflow_log_key(update['task_id']), {
+                    'step_id': update['step_id'],
+                    'status': update['status'],
+                    'message': update['message'] or '',
+                    'workflow_type': update['workflow_type'],
+                }, maxlen=WORKFLOW_LOG_MAXLEN, approximate=True)
+            for task_id in {update['task_id'] for update in accepted}:
+                pipe.expire(f"workflow_state:{task_id}", WORKFLOW_STATE_TTL_SECONDS)
+                pipe.expire(workflow_log_key(task_id), WORKFLOW_STATE_TTL_SECONDS)
+            replies = pipe.execute()
+            for update, position in zip(accepted, log_positions):
+                update['event_id'] = replies[position]
+            for update, position in zip(accepted, timing_positions):
+                step_ms, total_ms = replies[position]
+                update['duration_ms'] = step_ms if step_ms >= 0 else None
+                update['total_ms'] = total_ms if total_ms >= 0 else None
+            print(f"Saved {len(accepted)} step state(s) to Redis.")
+        except Exception as e:
+            # Nothing is broadcast; the caller must not acknowledge these events
+            print(f"ERROR saving step state to Redis: {e}")
+            raise
+
+    for update in accepted:
+        emitter.emit('status_update', {
+            'step_id': update['step_id'],
+            'status': update['status'],
+            'message': update['message'],
+            'workflow_type': update['workflow_type'],
+            'event_id': update.get('event_id'),
+            'progress': step_progress(update['step'], update['status']),
+            'position': update['step'].position,
+            'total_steps': update['step'].total,
+            'out_of_order': update['out_of_order'],
+            'received_at_ms': update['received_at_ms'],
+            'duration_ms': update.get('duration_ms'),
+            'total_ms': update.get('total_ms'),
+        }, room=update['task_id'], key=update['step_id'])
+
+    for update in accepted:
+        if not update['finish']:
+            continue
+        if redis_conn:
+            try:
+                # Update main task status (for /tasks page) and record workflow_finish in the
+                # same write. Refused for an event older than the task's last write, and
+                # once the task is finished, so a late 'fail' cannot overwrite SUCCESS
+                task_page_status = "SUCCESS" if update['finish']['status'] == 'success' else "FAILURE"
+                if transition_task(
+                    update['task_id'], task_page_status, update['finish']['message'],
+                    at=update['received_at_ms'], workflow_finish=update['finish'],
+                ) is None:
+                    continue # stale, or the task already finished: nothing to announce
+            except Exception as e:
+                print(f"ERROR saving final workflow state to Redis: {e}")
+                raise
+        update_app_status_via_api(update['global_status'])
+    return results
+
+
+def get_workflow_snapshot(task_id):
+    """
+    The step states and step durations of a workflow plus the ID of the last
+    logged event, read atomically so a client can resume the log exactly
+    where the snapshot ends. Returns (raw state hash, {step_id: duration_ms},
+    last_event_id or None).
+    """
+    redis_conn = current_app.redis_conn
+    pipe = redis_conn.pipeline() # MULTI, like the writes in apply_step_updates
+    pipe.hgetall(f"workflow_state:{task_id}")
+    pipe.hgetall(workflow_timing_key(task_id))
+    pipe.xrevrange(workflow_log_key(task_id), count=1)
+    state_data, timing, last_event = pipe.execute()
+    return state_data, step_timings(timing), (last_event[0][0] if last_event else None)
+
+
+def replay_step_events(task_id, after_id):
+    """Logged step events of a task after `after_id`, oldest first, as status_update payloads."""
+    entries = current_app.redis_conn.xrange(workflow_log_key(task_id), min=f"({after_id}", max='+', count=REPLAY_LIMIT)
+    return [
+        {
+            'step_id': fields.get('step_id'),
+            'status': fields.get('status'),
+            'message': fields.get('message') or None,
+            'workflow_type': fields.get('workflow_type'),
+            'event_id': event_id,
+        }
+        for event_id, fields in entries
+    ]
+
+
+def enqueue_step_updates(items):
+    """
+    Validate step callbacks and append the valid ones to STEP_EVENTS_STREAM
+    in one round-trip, without applying them. Returns one result dict per
+    item, in order, carrying the stream ID of each queued event. Raises
+    IngestBacklogFull when the consumers are too far behind.
+    """
+    redis_conn = current_app.redis_conn
+    max_backlog = current_app.config['WORKFLOW_EVENTS_MAX_BACKLOG']
+    if step_event_backlog(redis_conn, max_backlog)['backlog'] >= max_backlog:
+        redis_conn.hincrby(STEP_EVENTS_STATS_KEY, 'rejected_backlog_full', len(items))
+        raise IngestBacklogFull(f"More than {max_backlog} step updates are waiting to be processed")
+
+    results = []
+    queued = []
+    for index, data in enumerate(items):
+        try:
+            update = _parse_step_update(data)
+        except ValueError as e:
+            print(f"Webhook Error: {e}")
+            results.append({'index': index, 'status': 'error', 'error': str(e)})
+            continue
+        queued.append(index)
+        results.append({'index': index, 'status': 'queued', 'task_id': update['task_id'], 'step_id': update['step_id']})
+
+    if queued:
+        pipe = redis_conn.pipeline()
+        for index in queued:
+            pipe.xadd(
+                STEP_EVENTS_STREAM, {'payload': json.dumps(items[index])},
+                maxlen=current_app.config['WORKFLOW_EVENTS_MAXLEN'], approximate=True,
+            )
+        pipe.hincrby(STEP_EVENTS_STATS_KEY, 'enqueued', len(queued))
+        event_ids = pipe.execute()[:len(queued)]
+        for index, event_id in zip(queued, event_ids):
+            results[index]['event_id'] = event_id
+    return results
+
+
+def step_delivery_id(data, idempotency_key=None):
+    """
+    Dedup ID of one step callback: its idempotency key (the request header,
+    or an 'idempotency_key' field), otherwise a hash of task, step, status
+    and message. None for items that are not objects.
+    """
+    if not isinstance(data, dict):
+        return None
+    return delivery_id(
+        idempotency_key or data.get('idempotency_key'),
+        data.get('flask_task_id') or data.get('task_id'), data.get('workflow_type'),
+        data.get('step_id'), data.get('status'), data.get('message'),
+    )
+
+
+def ingest_step_updates(items, handler, idempotency_key=None):
+    """
+    Run `handler` (apply_step_updates or enqueue_step_updates) on the step
+    callbacks that were not delivered before. Malformed callbacks and unknown
+    steps are rejected before anything is written, the dedup claim included.
+    Retried deliveries are answered as 'duplicate' without touching the
+    workflow state, the queue or the sockets. Deliveries that fail are
+    released so their retry goes through. Returns one result dict per item,
+    in order.
+    """
+    results = [None] * len(items)
+    valid = []
+    for index, data in enumerate(items):
+        try:
+            _parse_step_update(data)
+        except ValueError as e:
+            print(f"Webhook Error: {e}")
+            results[index] = {'index': index, 'status': 'error', 'error': str(e)}
+            continue
+        valid.append(index)
+    if not valid:
+        return results
+
+    delivery_ids = {index: step_delivery_id(items[index], idempotency_key) for index in valid}
+    claimed = claim_deliveries('workflow_step', [delivery_ids[index] for index in valid])
+    fresh = [index for index, first in zip(valid, claimed) if first]
+
+    try:
+        handled = handler([items[index] for index in fresh]) if fresh else []
+    except Exception:
+        release_deliveries('workflow_step', [delivery_ids[index] for index in fresh])
+        raise
+
+    failed = []
+    for index, result in zip(fresh, handled):
+        result['index'] = index
+        results[index] = result
+        if result['status'] == 'error':
+            failed.append(delivery_ids[index])
+    release_deliveries('workflow_step', failed)
+
+    duplicates = len(valid) - len(fresh)
+    for index, first in zip(valid, claimed):
+        if not first:
+            results[index] = {'index': index, 'status': 'duplicate'}
+    if duplicates:
+        print(f"Skipped {duplicates} duplicate step update delivery(ies).")
+        current_app.redis_conn.hincrby(STEP_EVENTS_STATS_KEY, 'duplicates', duplicates)
+    return results
+
+
+def ensure_step_event_group(redis_conn):
+    """Create the consumer group, starting from the oldest queued event, if it does not exist."""
+    try:
+        redis_conn.xgroup_create(STEP_EVENTS_STREAM, STEP_EVENTS_GROUP, id='0', mkstream=True)
+    except Exception as e:
+        if 'BUSYGROUP' not in str(e):
+            raise
+
+
+def consume_step_events(consumer_name):
+    """
+    Read one batch of queued step events for `consumer_name`, apply them with
+    apply_step_updates and acknowledge them once applied. Events left
+    unacknowledged, by a consumer that died or by a batch that could not be
+    saved (the error is raised), are claimed again once idle for
+    WORKFLOW_EVENTS_CLAIM_IDLE_MS. Blocks up to WORKFLOW_EVENTS_BLOCK_MS when
+    the queue is empty. Returns the number of events processed.
+    """
+    redis_conn = current_app.redis_conn
+    config = current_app.config
+    batch_size = config['WORKFLOW_EVENTS_BATCH_SIZE']
+
+    _, entries, *_ = redis_conn.xautoclaim(
+        STEP_EVENTS_STREAM, STEP_EVENTS_GROUP, consumer_name,
+        min_idle_time=config['WORKFLOW_EVENTS_CLAIM_IDLE_MS'], start_id='0-0', count=batch_size,
+    )
+    trimmed = [entry[0] for entry in entries if entry and not entry[1]]
+    if trimmed:
+        # Trimmed from the stream while pending: nothing left to apply
+        redis_conn.xack(STEP_EVENTS_STREAM, STEP_EVENTS_GROUP, *trimmed)
+    entries = [entry for entry in entries if entry and entry[1]]
+    if not entries:
+        response = redis_conn.xreadgroup(
+            STEP_EVENTS_GROUP, consumer_name, {STEP_EVENTS_STREAM: '>'},
+            count=batch_size, block=config['WORKFLOW_EVENTS_BLOCK_MS'],
+        )
+        entries = response[0][1] if response else []
+    if not entries:
+        return 0
+
+    event_ids = []
+    malformed = []
+    updates = []
+    received_at_ms = []
+    for event_id, fields in entries:
+        try:
+            updates.append(json.loads(fields['payload']))
+        except (KeyError, TypeError, ValueError):
+            print(f"Warning: Dropping malformed step event '{event_id}'.")
+            malformed.append(event_id)
+            continue
+        event_ids.append(event_id)
+        # The stream ID is the time the webhook received the event
+        received_at_ms.append(int(event_id.split('-')[0]))
+    if malformed:
+        redis_conn.xack(STEP_EVENTS_STREAM, STEP_EVENTS_GROUP, *malformed)
+    if not event_ids:
+        return len(malformed)
+
+    started = time.monotonic()
+    # Raises when the updates could not be saved: they stay pending and are
+    # claimed again once idle for WORKFLOW_EVENTS_CLAIM_IDLE_MS
+    apply_step_updates(updates, received_at_ms)
+    pipe = redis_conn.pipeline()
+    pipe.xack(STEP_EVENTS_STREAM, STEP_EVENTS_GROUP, *event_ids)
+    pipe.hincrby(STEP_EVENTS_STATS_KEY, 'processed', len(event_ids))
+    pipe.hincrby(STEP_EVENTS_STATS_KEY, 'batches', 1)
+    pipe.execute()
+    print(f"Processed {len(event_ids)} step event(s) in {(time.monotonic() - started) * 1000:.0f} ms.")
+    return len(event_ids) + len(malformed)
+
+
+def step_event_backlog(redis_conn, limit):
+    """
+    Step events waiting for the consumer group: {'lag', 'pending', 'backlog'}.
+    `limit` bounds the count when Redis cannot report the lag (after entries
+    were deleted from the middle of the stream). Before the group exists
+    every queued event is waiting.
+    """
+    try:
+        groups = redis_conn.xinfo_groups(STEP_EVENTS_STREAM)
+    except redis.exceptions.ResponseError:
+        groups = [] # the stream does not exist yet
+    group = next((g for g in groups if g.get('name') == STEP_EVENTS_GROUP), None)
+    if group is None:
+        lag = redis_conn.xlen(STEP_EVENTS_STREAM)
+        return {'lag': lag, 'pending': 0, 'backlog': lag}
+
+    lag = group.get('lag')
+    if lag is None:
+        undelivered = redis_conn.xrange(
+            STEP_EVENTS_STREAM, min=f"({group['last-delivered-id']}", max='+', count=limit,
+        )
+        lag = len(undelivered)
+    pending = group.get('pending') or 0
+    return {'lag': lag, 'pending': pending, 'backlog': lag + pending}
+
+
+def get_step_event_metrics():
+    """Queue depth and throughput counters of the step-event stream."""
+    redis_conn = current_app.redis_conn
+    max_backlog = current_app.config['WORKFLOW_EVENTS_MAX_BACKLOG']
+    backlog = step_event_backlog(redis_conn, max_backlog)
+    pipe = redis_conn.pipeline(transaction=False)
+    pipe.xlen(STEP_EVENTS_STREAM)
+    pipe.hgetall(STEP_EVENTS_STATS_KEY)
+    pipe.xpending(STEP_EVENTS_STREAM, STEP_EVENTS_GROUP)
+    pipe.xinfo_consumers(STEP_EVENTS_STREAM, STEP_EVENTS_GROUP)
+    length, stats, pending, consumers = pipe.execute(raise_on_error=False)
+
+    metrics = {
+        'stream_length': length if isinstance(length, int) else 0,
+        'backlog': backlog['backlog'],
+        'lag': backlog['lag'],
+        'max_backlog': max_backlog,
+        'stats': {field: int(value) for field, value in stats.items()} if isinstance(stats, dict) else {},
+        'pending': 0,
+        'oldest_pending_age_ms': None,
+        'consumers': [],
+    }
+    if isinstance(pending, dict):
+        metrics['pending'] = pending.get('pending', 0)
+        if pending.get('min'):
+            metrics['oldest_pending_age_ms'] = int(time.time() * 1000) - int(pending['min'].split('-')[0])
+    if isinstance(consumers, list):
+        metrics['consumers'] = [
+            {'name': c['name'], 'pending': c['pending'], 'idle_ms': c['idle']} for c in consumers
+        ]
+    return metrics
@@ -10,6 +10,7 @@ celery = Celery(
         'blueprints.main.tasks',
         'blueprints.summary.task',
         'blueprints.upload.task',
+        'blueprints.tasks.task',
     ]
 )
 
@@ -20,6 +21,13 @@ celery.conf.update(
     timezone='Asia/Jakarta',
     enable_utc=False,
     broker_connection_retry_on_startup=True,
+    # Run the worker with -B to execute these
+    beat_schedule={
+        'archive-finished-tasks': {
+            'task': 'blueprints.tasks.task.archive_tasks',
+            'schedule': Config.TASK_ARCHIVE_INTERVAL_SECONDS,
+        },
+    },
 )
 
 # Apply the detailed Celery configuration
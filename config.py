@@ -15,6 +15,31 @@ class Config:
     REDIS_HOST = os.getenv('REDIS_HOST')
     REDIS_PORT = int(os.getenv('REDIS_PORT'))
     REDIS_DB = int(os.getenv('REDIS_DB', 0))
+    # Shared connection pool (see redis_setup.py), one per process
+    REDIS_MAX_CONNECTIONS = int(os.getenv('REDIS_MAX_CONNECTIONS', 50))
+    REDIS_POOL_TIMEOUT = int(os.getenv('REDIS_POOL_TIMEOUT', 5)) # wait for a free connection before failing
+    REDIS_SOCKET_TIMEOUT = float(os.getenv('REDIS_SOCKET_TIMEOUT', 10)) # keep above WORKFLOW_EVENTS_BLOCK_MS
+    REDIS_SOCKET_CONNECT_TIMEOUT = float(os.getenv('REDIS_SOCKET_CONNECT_TIMEOUT', 5))
+    REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv('REDIS_HEALTH_CHECK_INTERVAL', 30)) # PING idle connections before reuse
+    REDIS_RETRY_ATTEMPTS = int(os.getenv('REDIS_RETRY_ATTEMPTS', 3)) # retries on connection errors, with backoff
+    # Approximate number of entries kept in the global status history stream
+    STATUS_HISTORY_MAXLEN = int(os.getenv('STATUS_HISTORY_MAXLEN', 1000))
+
+    # n8n step callbacks are queued on a Redis stream and applied by workflow_consumer.py.
+    # Set WORKFLOW_EVENTS_ASYNC=false to apply them inside the webhook request instead.
+    WORKFLOW_EVENTS_ASYNC = os.getenv('WORKFLOW_EVENTS_ASYNC', 'true').lower() == 'true'
+    WORKFLOW_EVENTS_MAX_BACKLOG = int(os.getenv('WORKFLOW_EVENTS_MAX_BACKLOG', 10000)) # webhook answers 503 above this
+    WORKFLOW_EVENTS_MAXLEN = int(os.getenv('WORKFLOW_EVENTS_MAXLEN', 100000)) # approximate stream cap
+    WORKFLOW_EVENTS_BATCH_SIZE = int(os.getenv('WORKFLOW_EVENTS_BATCH_SIZE', 100))
+    WORKFLOW_EVENTS_BLOCK_MS = int(os.getenv('WORKFLOW_EVENTS_BLOCK_MS', 2000))
+    WORKFLOW_EVENTS_CLAIM_IDLE_MS = int(os.getenv('WORKFLOW_EVENTS_CLAIM_IDLE_MS', 60000)) # re-deliver events of dead consumers
+
+    # Webhook deliveries (by idempotency key or content hash) seen within this window are answered
+    # as duplicates without side effects, so n8n retries do not repeat writes and broadcasts
+    WEBHOOK_DEDUP_TTL_SECONDS = int(os.getenv('WEBHOOK_DEDUP_TTL_SECONDS', 600))
+
+    # Socket.IO status broadcasts are coalesced over this window (0 = send immediately)
+    SOCKETIO_COALESCE_WINDOW_MS = int(os.getenv('SOCKETIO_COALESCE_WINDOW_MS', 250))
 
     # N8N Webhook URL
     N8N_WEBHOOK_URL = os.getenv("N8N_WEBHOOK_URL")
@@ -23,6 +48,12 @@ class Config:
     # SQLAlchemy Database URL
     SQLALCHEMY_DATABASE_URI = os.getenv("DATABASE_URL")
 
+    # Task archive: finished tasks move from Redis to the task_archive table
+    # once their last update is TASK_ARCHIVE_AFTER_SECONDS old.
+    TASK_ARCHIVE_AFTER_SECONDS = int(os.getenv('TASK_ARCHIVE_AFTER_SECONDS', 3600))
+    TASK_ARCHIVE_BATCH_SIZE = int(os.getenv('TASK_ARCHIVE_BATCH_SIZE', 200))
+    TASK_ARCHIVE_INTERVAL_SECONDS = int(os.getenv('TASK_ARCHIVE_INTERVAL_SECONDS', 300))
+
     # GCP Bucket Config
     GCP_BUCKET_NAME = os.getenv("GCP_BUCKET_NAME")
     N8N_SUMMARY_WEBHOOK_URL = os.getenv("N8N_SUMMARY_WEBHOOK_URL")
@@ -77,6 +108,21 @@ class Config:
     R2_ENDPOINT_URL = os.getenv("R2_ENDPOINT_URL")  # if not set, will be constructed from R2_ACCOUNT_ID
     R2_REGION = os.getenv("R2_REGION", "auto")
     R2_BUCKET_NAME = os.getenv("R2_BUCKET_NAME", "skripsi")
+    # The shared R2 client (see r2_storage.py); R2_ADDRESSING_STYLE=path for MinIO and other local stand-ins
+    R2_MAX_POOL_CONNECTIONS = int(os.getenv("R2_MAX_POOL_CONNECTIONS", 20))
+    R2_CONNECT_TIMEOUT = int(os.getenv("R2_CONNECT_TIMEOUT", 5))
+    R2_READ_TIMEOUT = int(os.getenv("R2_READ_TIMEOUT", 60))
+    R2_RETRY_ATTEMPTS = int(os.getenv("R2_RETRY_ATTEMPTS", 5))
+    R2_ADDRESSING_STYLE = os.getenv("R2_ADDRESSING_STYLE", "auto")
+    # Local disk cache of downloaded R2 objects (see r2_cache.py), shared by all workers on a host
+    R2_CACHE_DIR = os.getenv("R2_CACHE_DIR", "instance/r2_cache")
+    R2_CACHE_MAX_BYTES = int(os.getenv("R2_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+    R2_CACHE_REVALIDATE_SECONDS = int(os.getenv("R2_CACHE_REVALIDATE_SECONDS", 300)) # If-None-Match check after this
+    # Reports prepared for paging/sorting (see blueprints/summary/report_table.py), and
+    # how many of them each process keeps in memory
+    REPORT_TABLE_DIR = os.getenv("REPORT_TABLE_DIR", "instance/report_tables")
+    REPORT_TABLE_MAX_BYTES = int(os.getenv("REPORT_TABLE_MAX_BYTES", 512 * 1024 * 1024))
+    REPORT_TABLE_CACHE_SIZE = int(os.getenv("REPORT_TABLE_CACHE_SIZE", 4))
     # Default key template: prediction/{date}.csv (e.g., prediction/2025-10-24.csv)
     # SUMMARY_R2_KEY_TEMPLATE = os.getenv("SUMMARY_R2_KEY_TEMPLATE", "prediction/{date}.csv")
 
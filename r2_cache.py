@@ -0,0 +1,181 @@
+# r2_cache.py
+import hashlib
+import json
+import os
+import tempfile
+import time
+from botocore.exceptions import BotoCoreError, ClientError
+
+# Size-bounded on-disk cache of R2 objects, shared by every process on the
+# host (Gunicorn workers, Celery workers). Each object is stored as
+# <sha256 of bucket/key>.data plus a .json file with its ETag. Both are
+# written to a temporary file and moved into place with os.replace, so
+# readers never see a partial file. A file's mtime is bumped on every read
+# and the least recently used objects are deleted once the cache is over
+# its size limit. An entry older than `revalidate_seconds` is revalidated
+# with a conditional GET (If-None-Match); a 304 costs no egress.
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class R2ObjectCache:
+    def __init__(self, cache_dir, max_bytes, revalidate_seconds):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.revalidate_seconds = revalidate_seconds
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+
+    def _paths(self, bucket, key):
+        name = hashlib.sha256(f"{bucket}/{key}".encode('utf-8')).hexdigest()
+        base = os.path.join(self.cache_dir, name)
+        return base + '.data', base + '.json'
+
+    def _read_meta(self, meta_path, data_path):
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return meta if os.path.exists(data_path) else None
+
+    def _write_atomic(self, path, write):
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def _store(self, obj, bucket, key, data_path, meta_path):
+        def copy_body(f):
+            for chunk in iter(lambda: obj['Body'].read(CHUNK_SIZE), b''):
+                f.write(chunk)
+
+        self._write_atomic(data_path, copy_body)
+        meta = {'bucket': bucket, 'key': key, 'etag': obj.get('ETag'), 'validated_at': time.time()}
+        self._write_atomic(meta_path, lambda f: f.write(json.dumps(meta).encode('utf-8')))
+
+    def _touch(self, *paths):
+        for path in paths:
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+
+    def fetch(self, s3, bucket, key):
+        """
+        Local path of the object `bucket/key`, downloaded on a miss and
+        revalidated when stale. Errors of the first download (e.g.
+        NoSuchKey) are raised; when a revalidation fails the cached copy is
+        served as is.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        data_path, meta_path = self._paths(bucket, key)
+        meta = self._read_meta(meta_path, data_path)
+
+        if meta is not None:
+            if time.time() - meta.get('validated_at', 0) < self.revalidate_seconds:
+                self.hits += 1
+                self._touch(data_path)
+                return data_path
+            conditional = {'IfNoneMatch': meta['etag']} if meta.get('etag') else {}
+            try:
+                obj = s3.get_object(Bucket=bucket, Key=key, **conditional)
+            except ClientError as e:
+                status = e.response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+                if status != 304 and e.response.get('Error', {}).get('Code') not in ('304', 'NotModified'):
+                    raise
+                meta['validated_at'] = time.time()
+                self._write_atomic(meta_path, lambda f: f.write(json.dumps(meta).encode('utf-8')))
+                self.revalidated += 1
+                self._touch(data_path)
+                return data_path
+            except BotoCoreError as e:
+                print(f"Warning: Could not revalidate cached R2 object '{bucket}/{key}', serving the cached copy: {e}")
+                self._touch(data_path)
+                return data_path
+            print(f"R2 object '{bucket}/{key}' changed (ETag {meta.get('etag')} -> {obj.get('ETag')}), refreshing the cache.")
+        else:
+            obj = s3.get_object(Bucket=bucket, Key=key)
+
+        self.misses += 1
+        self._store(obj, bucket, key, data_path, meta_path)
+        self.evict(keep=data_path)
+        return data_path
+
+    def cached_etag(self, bucket, key):
+        """ETag of the cached copy of `bucket/key` ('' when unknown), to tell its versions apart."""
+        data_path, meta_path = self._paths(bucket, key)
+        meta = self._read_meta(meta_path, data_path)
+        return (meta or {}).get('etag') or ''
+
+    def evict(self, keep=None):
+        """Delete least recently used objects until the cache fits in max_bytes, sparing `keep`."""
+        entries = []
+        total = 0
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return 0
+        for name in names:
+            if not name.endswith('.data'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue # removed by another process
+            total += stat.st_size
+            if path != keep:
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+        removed = 0
+        for _mtime, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            base = os.path.join(self.cache_dir, name[:-len('.data')])
+            for path in (base + '.json', base + '.data'):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= size
+            removed += 1
+        if removed:
+            print(f"Evicted {removed} object(s) from the R2 cache.")
+        return removed
+
+    def stats(self):
+        """Hit/miss counters of this process plus the current size on disk."""
+        files = [name for name in os.listdir(self.cache_dir) if name.endswith('.data')] if os.path.isdir(self.cache_dir) else []
+        size = 0
+        for name in files:
+            try:
+                size += os.path.getsize(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+        return {
+            'objects': len(files), 'bytes': size, 'max_bytes': self.max_bytes,
+            'hits': self.hits, 'revalidated': self.revalidated, 'misses': self.misses,
+        }
+
+
+_caches = {}
+
+
+def get_r2_cache(config):
+    """The R2 object cache configured for this process."""
+    cache_dir = os.path.abspath(config['R2_CACHE_DIR'])
+    cache = _caches.get(cache_dir)
+    if cache is None:
+        cache = _caches[cache_dir] = R2ObjectCache(
+            cache_dir, config['R2_CACHE_MAX_BYTES'], config['R2_CACHE_REVALIDATE_SECONDS'],
+        )
+    return cache
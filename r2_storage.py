@@ -0,0 +1,73 @@
+# r2_storage.py
+import os
+import threading
+import boto3
+from botocore.config import Config as BotoConfig
+
+# One S3 client for Cloudflare R2 per process, shared by every upload and
+# download path (report pages, the rows API, the Celery upload and report
+# tasks). Building a client costs tens of milliseconds and each one owns its
+# own HTTP connection pool, so reusing it keeps the TLS connections to R2
+# alive between requests. boto3 clients are thread-safe once built; they are
+# built from a private Session under a lock because the default session is
+# not. The client is rebuilt in a forked child (Gunicorn/Celery workers)
+# rather than sharing the parent's sockets. Any S3-compatible endpoint works
+# (MinIO or moto for local testing): set R2_ENDPOINT_URL, and
+# R2_ADDRESSING_STYLE=path when the server has no virtual-host buckets.
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _endpoint_url(config):
+    endpoint_url = config.get('R2_ENDPOINT_URL')
+    if endpoint_url:
+        return endpoint_url
+    account_id = config.get('R2_ACCOUNT_ID')
+    if not account_id:
+        raise ValueError("R2 endpoint not configured. Set R2_ENDPOINT_URL or R2_ACCOUNT_ID.")
+    return f"https://{account_id}.r2.cloudflarestorage.com"
+
+
+def _create_client(config, endpoint_url):
+    access_key = config.get('R2_ACCESS_KEY_ID')
+    secret_key = config.get('R2_SECRET_ACCESS_KEY')
+    if not (access_key and secret_key):
+        raise ValueError("R2 credentials not configured. Set R2_ACCESS_KEY_ID and R2_SECRET_ACCESS_KEY.")
+
+    session = boto3.session.Session()
+    return session.client(
+        's3',
+        aws_access_key_id=access_key,
+        aws_secret_access_key=secret_key,
+        endpoint_url=endpoint_url,
+        region_name=config.get('R2_REGION', 'auto'),
+        config=BotoConfig(
+            max_pool_connections=config['R2_MAX_POOL_CONNECTIONS'],
+            tcp_keepalive=True,
+            connect_timeout=config['R2_CONNECT_TIMEOUT'],
+            read_timeout=config['R2_READ_TIMEOUT'],
+            # 'adaptive' also slows the client down when R2 throttles (HTTP 429/503)
+            retries={'mode': 'adaptive', 'total_max_attempts': config['R2_RETRY_ATTEMPTS']},
+            s3={'addressing_style': config['R2_ADDRESSING_STYLE']},
+        ),
+    )
+
+
+def get_r2_client(config):
+    """
+    (S3 client, bucket) for the R2 bucket of `config`, the client created on
+    first use in this process. Raises ValueError with a message for the user
+    when R2 is not configured.
+    """
+    endpoint_url = _endpoint_url(config)
+    client_key = (os.getpid(), endpoint_url, config.get('R2_ACCESS_KEY_ID'))
+    client = _clients.get(client_key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(client_key)
+            if client is None:
+                # Drop clients inherited from a parent process
+                for stale in [key for key in _clients if key[0] != client_key[0]]:
+                    del _clients[stale]
+                client = _clients[client_key] = _create_client(config, endpoint_url)
+    return client, config.get('R2_BUCKET_NAME', 'skripsi')
@@ -0,0 +1,102 @@
+# redis_setup.py
+import os
+import threading
+import redis
+from redis.backoff import ExponentialBackoff
+from redis.retry import Retry
+
+# One connection pool per process (and per decode_responses mode), shared by
+# every client handed out here: the Flask app, Celery tasks, the workflow
+# consumer and the status cache all reuse the same sockets instead of opening
+# a new connection per request. redis-py resets a pool inherited across a
+# fork, so Gunicorn and Celery worker children each get their own.
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class _CountingConnectionPool(redis.BlockingConnectionPool):
+    """A BlockingConnectionPool that counts the connections it creates and lends out."""
+
+    def reset(self):
+        # Also called by redis-py in a forked child, which starts with no connections
+        self._stats_lock = threading.Lock()
+        self.created_connections = 0
+        self._lent = set()
+        super().reset()
+
+    def make_connection(self):
+        connection = super().make_connection()
+        with self._stats_lock:
+            self.created_connections += 1
+        return connection
+
+    def get_connection(self, *args, **kwargs):
+        connection = super().get_connection(*args, **kwargs)
+        with self._stats_lock:
+            self._lent.add(id(connection))
+        return connection
+
+    def release(self, connection):
+        with self._stats_lock:
+            self._lent.discard(id(connection))
+        super().release(connection)
+
+    @property
+    def in_use_connections(self):
+        with self._stats_lock:
+            return len(self._lent)
+
+
+def _create_pool(config, decode_responses):
+    return _CountingConnectionPool(
+        host=config['REDIS_HOST'],
+        port=config['REDIS_PORT'],
+        db=config['REDIS_DB'],
+        decode_responses=decode_responses,
+        max_connections=config['REDIS_MAX_CONNECTIONS'],
+        timeout=config['REDIS_POOL_TIMEOUT'], # seconds to wait for a free connection
+        socket_timeout=config['REDIS_SOCKET_TIMEOUT'],
+        socket_connect_timeout=config['REDIS_SOCKET_CONNECT_TIMEOUT'],
+        socket_keepalive=True,
+        health_check_interval=config['REDIS_HEALTH_CHECK_INTERVAL'],
+        # Only connection errors are retried: a command that timed out may
+        # already have run, and running a script like EVALSHA twice is not safe
+        retry=Retry(
+            ExponentialBackoff(), config['REDIS_RETRY_ATTEMPTS'], supported_errors=(redis.exceptions.ConnectionError,),
+        ),
+        retry_on_error=[redis.exceptions.ConnectionError],
+    )
+
+
+def get_redis_pool(config, decode_responses=True):
+    """The process-wide connection pool for `config`, created on first use."""
+    with _pools_lock:
+        pool = _pools.get(decode_responses)
+        if pool is None:
+            pool = _pools[decode_responses] = _create_pool(config, decode_responses)
+        return pool
+
+
+def get_redis_client(config, decode_responses=True):
+    """
+    A Redis client on the shared pool. Clients are cheap; the pool holds the
+    connections. Use decode_responses=False for binary values.
+    """
+    return redis.StrictRedis(connection_pool=get_redis_pool(config, decode_responses))
+
+
+def get_redis_pool_stats():
+    """Size and usage of every pool of this process."""
+    stats = {'pid': os.getpid(), 'pools': []}
+    with _pools_lock:
+        pools = list(_pools.items())
+    for decode_responses, pool in pools:
+        created, in_use = pool.created_connections, pool.in_use_connections
+        stats['pools'].append({
+            'decode_responses': decode_responses,
+            'max_connections': pool.max_connections,
+            'created_connections': created,
+            'in_use_connections': in_use,
+            'idle_connections': max(0, created - in_use),
+        })
+    return stats
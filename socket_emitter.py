@@ -0,0 +1,69 @@
+# socket_emitter.py
+import atexit
+import threading
+
+
+class CoalescingEmitter:
+    """
+    Buffers Socket.IO broadcasts for a short window and sends them as one
+    'event_batch' frame per room. Within a window only the latest message per
+    (event, room, key) is kept, so a burst of updates to the same thing goes
+    out once. Every frame reports how many messages were collapsed into it.
+
+    `key` tells apart messages of one event that must not replace each other,
+    e.g. the step_id of a workflow 'status_update'. A window of 0 disables
+    coalescing and emits immediately.
+    """
+
+    def __init__(self, socketio, window_ms=250):
+        self.socketio = socketio
+        self.window = window_ms / 1000
+        self._lock = threading.Lock()
+        self._pending = {} # (room, event, key) -> data, in arrival order
+        self._collapsed = {} # room -> messages dropped in favour of a newer one
+        self._timer = None
+        self.sent_messages = 0
+        self.collapsed_messages = 0
+        atexit.register(self.flush)
+
+    def emit(self, event, data, room=None, key=None):
+        """Queue `data` for `event`, replacing any queued message with the same key."""
+        if self.window <= 0:
+            self.socketio.emit('event_batch', {'events': [{'event': event, 'data': data}], 'collapsed': 0}, room=room)
+            self.sent_messages += 1
+            return
+        with self._lock:
+            pending_key = (room, event, key)
+            if pending_key in self._pending:
+                # Re-insert so the batch keeps the order of the latest updates
+                del self._pending[pending_key]
+                self._collapsed[room] = self._collapsed.get(room, 0) + 1
+            self._pending[pending_key] = data
+            if self._timer is None:
+                self._timer = threading.Timer(self.window, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Send everything queued so far, one frame per room."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            collapsed, self._collapsed = self._collapsed, {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+        frames = {}
+        for (room, event, _key), data in pending.items():
+            frames.setdefault(room, []).append({'event': event, 'data': data})
+        for room, events in frames.items():
+            try:
+                self.socketio.emit('event_batch', {'events': events, 'collapsed': collapsed.get(room, 0)}, room=room)
+            except Exception as e:
+                print(f"Warning: Could not emit event batch to room '{room}': {e}")
+                continue
+            self.sent_messages += len(events)
+            self.collapsed_messages += collapsed.get(room, 0)
+            if collapsed.get(room):
+                target = f"room '{room}'" if room else "all clients"
+                print(f"Coalesced {len(events) + collapsed[room]} Socket.IO messages into {len(events)} for {target}.")
@@ -10,25 +10,33 @@ FLASK_PID=$!
 
 # Start the Celery worker in the background
 echo "Starting Celery worker..."
-uv run celery -A make_celery.celery worker --loglevel=info --pool=solo -n worker1@%h &
+uv run celery -A make_celery.celery worker -B --loglevel=info --pool=solo -n worker1@%h &
 CELERY_PID=$!
 
+# Start the workflow event consumer in the background
+echo "Starting workflow event consumer..."
+uv run python workflow_consumer.py &
+CONSUMER_PID=$!
+
 echo "Flask app running with PID: $FLASK_PID"
 echo "Celery worker running with PID: $CELERY_PID"
+echo "Workflow event consumer running with PID: $CONSUMER_PID"
 
 # Function to clean up processes
 cleanup() {
     echo "Caught SIGINT. Shutting down..."
     kill $FLASK_PID
     kill $CELERY_PID
+    kill $CONSUMER_PID
     # Wait for processes to terminate
     wait $FLASK_PID
     wait $CELERY_PID
+    wait $CONSUMER_PID
     echo "Shutdown complete."
 }
 
 # Trap SIGINT and call the cleanup function
 trap cleanup SIGINT
 
-# Wait for both processes to exit
-wait $FLASK_PID $CELERY_PID
+# Wait for all processes to exit
+wait $FLASK_PID $CELERY_PID $CONSUMER_PID
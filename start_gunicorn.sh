@@ -31,6 +31,9 @@ cleanup() {
     if [ -n "$CELERY_PID" ]; then
         kill -s TERM $CELERY_PID
     fi
+    if [ -n "$CONSUMER_PID" ]; then
+        kill -s TERM $CONSUMER_PID
+    fi
     echo "Shutdown complete."
 }
 
@@ -48,12 +51,18 @@ set +m
 
 # Start the Celery worker in the background
 echo "Starting Celery worker..."
-uv run celery -A make_celery.celery worker --loglevel=info --pool=solo -n worker1@%h &
+uv run celery -A make_celery.celery worker -B --loglevel=info --pool=solo -n worker1@%h &
 CELERY_PID=$!
 
+# Start the workflow event consumer in the background
+echo "Starting workflow event consumer..."
+uv run python workflow_consumer.py &
+CONSUMER_PID=$!
+
 echo "----------------------------------------"
 echo "Gunicorn running with PID: $GUNICORN_PID"
 echo "Celery worker running with PID: $CELERY_PID"
+echo "Workflow event consumer running with PID: $CONSUMER_PID"
 echo "Access your application at http://$HOST:$PORT"
 echo "Press Ctrl+C to shut down."
 echo "----------------------------------------"
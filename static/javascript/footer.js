@@ -32,6 +32,11 @@ document.addEventListener("DOMContentLoaded", function () {
         const colors = getStatusColors(status);
         
         footerStatusValue.textContent = status || "Loading..."; // Show Loading... if status is empty initially
+        if (timestamp) {
+            // Remember the last real status so it can be restored after a reconnect
+            footerStatusValue.dataset.status = status;
+            footerStatusValue.dataset.lastUpdated = timestamp;
+        }
         footerStatusValue.className = `text-sm font-medium ${colors.text}`;
         
         if (statusIndicator) {
@@ -61,6 +66,9 @@ document.addEventListener("DOMContentLoaded", function () {
         }
     }
 
+    // ID of the last status update shown, used to catch up after a reconnect
+    let lastStatusId = null;
+
     // --- FETCH INITIAL STATUS ON LOAD ---
     async function fetchInitialFooterStatus() {
         try {
@@ -69,6 +77,7 @@ document.addEventListener("DOMContentLoaded", function () {
                 throw new Error("API server initial fetch failed.");
             }
             const data = await response.json();
+            lastStatusId = data.id || null;
             updateStatusDisplay(data.status, data.last_updated);
         } catch (error) {
             console.error("Error fetching initial status for footer:", error);
@@ -76,13 +85,39 @@ document.addEventListener("DOMContentLoaded", function () {
         }
     }
 
+    // --- CATCH UP ON UPDATES MISSED WHILE DISCONNECTED ---
+    async function fetchMissedFooterStatus() {
+        try {
+            const response = await fetch(`/api/status/history?since=${encodeURIComponent(lastStatusId)}&limit=100`);
+            if (!response.ok) {
+                throw new Error("Status history fetch failed.");
+            }
+            const data = await response.json();
+            if (data.entries.length > 0) {
+                console.log(`Caught up on ${data.entries.length} missed status update(s).`);
+                const latest = data.entries[data.entries.length - 1];
+                lastStatusId = latest.id;
+                updateStatusDisplay(latest.status, latest.last_updated);
+            } else {
+                updateStatusDisplay(footerStatusValue.dataset.status, footerStatusValue.dataset.lastUpdated);
+            }
+        } catch (error) {
+            console.error("Error catching up on footer status:", error);
+            fetchInitialFooterStatus();
+        }
+    }
+
     // --- SOCKET.IO LISTENER FOR REAL-TIME UPDATES ---
     const socket = io(); // Connect to Socket.IO
 
     socket.on('connect', () => {
         console.log('Footer connected via WebSocket.');
-        // Fetch initial status once connected
-        fetchInitialFooterStatus(); 
+        // Fetch initial status once connected, or only what was missed after a reconnect
+        if (lastStatusId) {
+            fetchMissedFooterStatus();
+        } else {
+            fetchInitialFooterStatus();
+        }
     });
 
     socket.on('disconnect', () => {
@@ -90,9 +125,20 @@ document.addEventListener("DOMContentLoaded", function () {
         updateStatusDisplay("Disconnected", null); // Show disconnected status
     });
 
-    socket.on('global_status_update', (data) => {
+    function onGlobalStatusUpdate(data) {
         console.log('Received global status update:', data);
+        lastStatusId = data.id || lastStatusId;
         updateStatusDisplay(data.status, data.last_updated);
+    }
+
+    // Status broadcasts arrive coalesced: one frame holding the latest message per event
+    socket.on('event_batch', (frame) => {
+        if (frame.collapsed) {
+            console.log(`Event batch collapsed ${frame.collapsed} older message(s).`);
+        }
+        frame.events
+            .filter(({ event }) => event === 'global_status_update')
+            .forEach(({ data }) => onGlobalStatusUpdate(data));
     });
 
     // --- REMOVE POLLING ---
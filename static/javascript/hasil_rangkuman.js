@@ -0,0 +1,145 @@
+// Pages lazily through the full report on the result page. The first rows
+// are rendered by the server (smallest PRODUCT ID first); further rows, other
+// sort orders and filters come from /api/rangkuman/<task_id>/rows. When the
+// server streamed the first rows from the CSV instead of the prepared report
+// (data-rows-source="stream"), they are reloaded from the API first, so every
+// page comes from the same ordering.
+document.addEventListener('DOMContentLoaded', function() {
+    const container = document.getElementById('report-table');
+    const tbody = document.getElementById('report-rows');
+    if (!container || !tbody) {
+        return;
+    }
+
+    const PAGE_SIZE = 200;
+    const MAX_PAGE_SIZE = 1000; // the API's largest limit
+    const rowsUrl = container.dataset.rowsUrl;
+    const statusText = document.getElementById('report-table-status');
+    const filterForm = document.getElementById('report-filter-form');
+    const filterColumn = document.getElementById('report-filter-column');
+    const filterText = document.getElementById('report-filter-text');
+    const headerCells = container.querySelectorAll('th[data-column]');
+
+    // The server-rendered rows are sorted by PRODUCT ID when the report has it
+    const productIdHeader = Array.from(headerCells)
+        .map(th => th.dataset.column)
+        .find(name => name.trim().toLowerCase() === 'product id');
+
+    const state = {
+        sort: productIdHeader || '',
+        filter: '',
+        loaded: parseInt(container.dataset.loadedRows, 10) || 0,
+        matched: null, // unknown until the first API response
+        loading: false,
+        generation: 0, // bumped on every sort/filter change; stale responses are dropped
+    };
+
+    function renderRows(rows) {
+        const fragment = document.createDocumentFragment();
+        rows.forEach(row => {
+            const tr = document.createElement('tr');
+            tr.className = 'hover:bg-gray-50';
+            row.forEach((cell, index) => {
+                const td = document.createElement('td');
+                td.className = 'px-6 py-4 text-sm text-gray-700' + (index === 1 ? ' break-words' : '');
+                td.textContent = cell;
+                tr.appendChild(td);
+            });
+            fragment.appendChild(tr);
+        });
+        tbody.appendChild(fragment);
+    }
+
+    function updateStatus(message) {
+        if (!statusText) return;
+        if (message) {
+            statusText.textContent = message;
+        } else if (state.matched !== null) {
+            statusText.textContent = `Menampilkan ${state.loaded} dari ${state.matched} baris`;
+        }
+    }
+
+    function updateSortIndicators() {
+        headerCells.forEach(th => {
+            const name = th.dataset.column;
+            th.dataset.label = th.dataset.label || th.textContent.trim();
+            let arrow = '';
+            if (state.sort === name) arrow = ' ▲';
+            else if (state.sort === '-' + name) arrow = ' ▼';
+            th.textContent = th.dataset.label + arrow;
+        });
+    }
+
+    // reset: start over from the first row. refresh: also a reset, but replacing
+    // the rows already shown in place, without scrolling back to the top.
+    function loadRows(reset, refresh) {
+        if (state.loading && !reset) return;
+        if (!reset && state.matched !== null && state.loaded >= state.matched) return;
+
+        const generation = reset ? ++state.generation : state.generation;
+        const limit = refresh ? Math.min(Math.max(state.loaded, PAGE_SIZE), MAX_PAGE_SIZE) : PAGE_SIZE;
+        const params = new URLSearchParams({ offset: reset ? 0 : state.loaded, limit: limit });
+        if (state.sort) params.append('sort', state.sort);
+        if (state.filter) params.append('filter', state.filter);
+
+        state.loading = true;
+        updateStatus('Memuat...');
+        fetch(`${rowsUrl}?${params.toString()}`)
+            .then(response => response.json().then(data => {
+                if (!response.ok) throw new Error(data.error || `Server responded with status: ${response.status}`);
+                return data;
+            }))
+            .then(data => {
+                if (generation !== state.generation) return;
+                if (reset) {
+                    tbody.innerHTML = '';
+                    state.loaded = 0;
+                    if (!refresh) container.scrollTop = 0;
+                }
+                renderRows(data.rows);
+                state.loaded += data.rows.length;
+                state.matched = data.matched_rows;
+                state.loading = false;
+                updateStatus();
+            })
+            .catch(error => {
+                if (generation !== state.generation) return;
+                state.loading = false;
+                updateStatus(`Gagal memuat baris: ${error.message}`);
+            });
+    }
+
+    // Fetch the next page when the table is scrolled near its end
+    container.addEventListener('scroll', function() {
+        if (container.scrollTop + container.clientHeight >= container.scrollHeight - 200) {
+            loadRows(false);
+        }
+    });
+
+    headerCells.forEach(th => {
+        th.addEventListener('click', function() {
+            const name = th.dataset.column;
+            state.sort = state.sort === name ? '-' + name : name;
+            updateSortIndicators();
+            loadRows(true);
+        });
+    });
+
+    if (filterForm) {
+        filterForm.addEventListener('submit', function(event) {
+            event.preventDefault();
+            const text = filterText.value.trim();
+            state.filter = text ? `${filterColumn.value}:${text}` : '';
+            loadRows(true);
+        });
+    }
+
+    updateSortIndicators();
+    if (container.dataset.rowsSource === 'stream') {
+        // Replace the streamed rows with the same rows in the API's order
+        loadRows(true, true);
+    } else {
+        // Learn the total row count (and fill the table when the first rows fit on screen)
+        loadRows(false);
+    }
+});
@@ -11,12 +11,16 @@ document.addEventListener('DOMContentLoaded', function() {
     const closeModalBtn = document.getElementById('close-modal-btn');
     const modalTerminateBtn = document.getElementById('modal-terminate-btn');
     const modalRemoveBtn = document.getElementById('modal-remove-btn');
+    const loadMoreBtn = document.getElementById('load-more-btn');
+    const statusFilter = document.getElementById('status-filter');
 
     // --- State Variables ---
     let currentTaskId = null;
-    let refreshInterval = null;
+    let loadedTasks = [];
+    let nextBefore = null;
 
     // --- Configuration ---
+    const PAGE_SIZE = 50;
     const statusColors = {
         'PENDING': 'bg-yellow-100 text-yellow-800 border-yellow-200',
         'STARTED': 'bg-blue-100 text-blue-800 border-blue-200',
@@ -151,34 +155,53 @@ document.addEventListener('DOMContentLoaded', function() {
         `;
     }
 
+    async function fetchTasksPage(limit, before) {
+        let url = `/api/tasks?limit=${limit}`;
+        if (statusFilter.value) {
+            url += `&status=${encodeURIComponent(statusFilter.value)}`;
+        }
+        if (before !== null && before !== undefined) {
+            url += `&before=${encodeURIComponent(before)}`;
+        }
+        const response = await fetch(url);
+        if (!response.ok) {
+             throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        const page = await response.json();
+        if (!page || !Array.isArray(page.tasks)) {
+             throw new Error("Invalid response format: Expected a page of tasks.");
+        }
+        return page;
+    }
+
+    function renderTasks() {
+        if (loadedTasks.length === 0) {
+            tasksContainer.innerHTML = ''; // Clear previous tasks
+            emptyState.classList.remove('hidden');
+        } else {
+            emptyState.classList.add('hidden');
+            // Ensure sorting works even if created_at is missing or invalid
+            loadedTasks.sort((a, b) => {
+                 const dateA = a.created_at ? new Date(a.created_at).getTime() : 0;
+                 const dateB = b.created_at ? new Date(b.created_at).getTime() : 0;
+                 // Handle invalid dates by pushing them to the end
+                 if (isNaN(dateA) && isNaN(dateB)) return 0;
+                 if (isNaN(dateA)) return 1;
+                 if (isNaN(dateB)) return -1;
+                 return dateB - dateA; // Sort descending (newest first)
+             });
+            tasksContainer.innerHTML = loadedTasks.map(createTaskCard).join('');
+        }
+        loadMoreBtn.classList.toggle('hidden', nextBefore === null);
+    }
+
     async function loadTasks() {
         try {
-            const response = await fetch('/api/tasks');
-            if (!response.ok) {
-                 throw new Error(`HTTP error! status: ${response.status}`);
-            }
-            const tasks = await response.json();
-            if (!Array.isArray(tasks)) {
-                 throw new Error("Invalid response format: Expected an array of tasks.");
-            }
-
-            if (tasks.length === 0) {
-                tasksContainer.innerHTML = ''; // Clear previous tasks
-                emptyState.classList.remove('hidden');
-            } else {
-                emptyState.classList.add('hidden');
-                // Ensure sorting works even if created_at is missing or invalid
-                tasks.sort((a, b) => {
-                     const dateA = a.created_at ? new Date(a.created_at).getTime() : 0;
-                     const dateB = b.created_at ? new Date(b.created_at).getTime() : 0;
-                     // Handle invalid dates by pushing them to the end
-                     if (isNaN(dateA) && isNaN(dateB)) return 0;
-                     if (isNaN(dateA)) return 1;
-                     if (isNaN(dateB)) return -1;
-                     return dateB - dateA; // Sort descending (newest first)
-                 });
-                tasksContainer.innerHTML = tasks.map(createTaskCard).join('');
-            }
+            // Reload everything that is already on screen, but never less than one page
+            const page = await fetchTasksPage(Math.min(Math.max(PAGE_SIZE, loadedTasks.length), 500));
+            loadedTasks = page.tasks;
+            nextBefore = page.next_before;
+            renderTasks();
         } catch (error) {
             console.error('Error loading tasks:', error);
             tasksContainer.innerHTML = `<div class="bg-red-100 border border-red-300 rounded-xl p-4 text-red-800"><p>Error loading tasks: ${error.message}. Please try refreshing.</p></div>`;
@@ -186,6 +209,19 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
+    async function loadMoreTasks() {
+        if (nextBefore === null) return;
+        try {
+            const page = await fetchTasksPage(PAGE_SIZE, nextBefore);
+            loadedTasks = loadedTasks.concat(page.tasks);
+            nextBefore = page.next_before;
+            renderTasks();
+        } catch (error) {
+            console.error('Error loading more tasks:', error);
+            alert('Error loading more tasks: ' + error.message);
+        }
+    }
+
 
     window.showTaskDetail = async function(taskId) {
         currentTaskId = taskId;
@@ -233,8 +269,6 @@ document.addEventListener('DOMContentLoaded', function() {
                  throw new Error(result.error || `HTTP error! status: ${response.status}`);
              }
             alert(result.message || 'Abort signal sent.');
-            // Give Redis a moment to update before reloading
-            setTimeout(loadTasks, 1000);
         } catch (error) {
              console.error('Error aborting task:', error);
             alert('Error aborting task: ' + error.message);
@@ -251,6 +285,7 @@ document.addEventListener('DOMContentLoaded', function() {
                  if (taskCard) {
                      taskCard.remove();
                  }
+                 loadedTasks = loadedTasks.filter(task => task.task_id !== taskId);
                  // Check if container is now empty
                  if (!tasksContainer.hasChildNodes()) {
                      emptyState.classList.remove('hidden');
@@ -275,24 +310,33 @@ document.addEventListener('DOMContentLoaded', function() {
 
 
     refreshBtn.addEventListener('click', loadTasks);
+    loadMoreBtn.addEventListener('click', loadMoreTasks);
+    statusFilter.addEventListener('change', () => {
+        loadedTasks = [];
+        nextBefore = null;
+        loadTasks();
+    });
 
     clearCompletedBtn.addEventListener('click', async function() {
         if (!confirm('Are you sure you want to clear all completed, failed, and revoked tasks?')) return;
         try {
-             // Fetch only task IDs and statuses needed for filtering
-            const response = await fetch('/api/tasks');
-             if (!response.ok) {
-                 throw new Error(`HTTP error! status: ${response.status}`);
-             }
-            const tasks = await response.json();
-            if (!Array.isArray(tasks)) {
-                 throw new Error("Invalid response format: Expected an array of tasks.");
+            // Ask the server for finished tasks only, one status index at a time
+            const completedStatuses = ['SUCCESS', 'FAILURE', 'REVOKED', 'Prediksi Selesai', 'ABORTED'];
+            const responses = await Promise.all(completedStatuses.map(status =>
+                fetch(`/api/tasks?status=${encodeURIComponent(status)}`)
+            ));
+            let completedTaskIds = [];
+            for (const response of responses) {
+                if (!response.ok) {
+                    throw new Error(`HTTP error! status: ${response.status}`);
+                }
+                const tasks = await response.json();
+                if (!Array.isArray(tasks)) {
+                    throw new Error("Invalid response format: Expected an array of tasks.");
+                }
+                completedTaskIds = completedTaskIds.concat(tasks.map(task => task.task_id));
             }
 
-            const completedTaskIds = tasks
-                .filter(task => ['SUCCESS', 'FAILURE', 'REVOKED', 'Prediksi Selesai', 'ABORTED'].includes(task.status))
-                .map(task => task.task_id);
-
              if (completedTaskIds.length === 0) {
                  alert("No completed tasks to clear.");
                  return;
@@ -339,53 +383,50 @@ document.addEventListener('DOMContentLoaded', function() {
     modalTerminateBtn.addEventListener('click', () => { if (currentTaskId) abortTask(currentTaskId); });
     modalRemoveBtn.addEventListener('click', () => { if (currentTaskId) removeTask(currentTaskId); });
 
-    // --- Auto-Refresh Logic ---
-    function startAutoRefresh() {
-        if (refreshInterval) {
-             clearInterval(refreshInterval); // Clear existing interval if any
-         }
-        // Refresh every 7 seconds
-        refreshInterval = setInterval(loadTasks, 7000);
-         console.log("Auto-refresh started.");
-    }
-    function stopAutoRefresh() {
-        if (refreshInterval) {
-            clearInterval(refreshInterval);
-            refreshInterval = null;
-             console.log("Auto-refresh stopped.");
+    // --- Live Updates (Socket.IO) ---
+    // One snapshot is loaded on connect; after that the server pushes small
+    // task_update deltas to the 'tasks' room instead of us polling /api/tasks.
+    function applyTaskDelta(delta) {
+        const task = delta.task || {};
+        const index = loadedTasks.findIndex(t => t.task_id === task.task_id);
+        const filter = statusFilter.value;
+
+        if (delta.action === 'removed') {
+            if (index !== -1) loadedTasks.splice(index, 1);
+        } else if (index !== -1) {
+            const current = loadedTasks[index];
+            if (task.version !== undefined && current.version !== undefined && Number(task.version) <= Number(current.version)) {
+                return; // Already showing this write or a newer one
+            }
+            Object.assign(current, task);
+            if (filter && current.status !== filter) {
+                loadedTasks.splice(index, 1);
+            }
+        } else if (delta.action === 'created') {
+            if (!filter || task.status === filter) {
+                loadedTasks.push(task);
+            }
+        } else if (filter && task.status === filter) {
+            // A task we have not loaded moved into the filtered status: fetch a fresh snapshot
+            loadTasks();
+            return;
         }
+        renderTasks();
     }
 
-    // Pause refresh when the page is not visible
-    document.addEventListener('visibilitychange', () => {
-         console.log("Visibility changed:", document.hidden);
-        if (document.hidden) {
-             stopAutoRefresh();
-         } else {
-             // Reload immediately when tab becomes visible again, then restart interval
-             loadTasks();
-             startAutoRefresh();
-         }
+    const socket = io();
+
+    socket.on('connect', () => {
+        console.log('Tasks page connected via WebSocket.');
+        socket.emit('join', { room: 'tasks' });
+        // (Re)load the snapshot so nothing missed while disconnected is lost
+        loadTasks();
     });
 
-    // Initial load and start refresh
-    loadTasks();
-    startAutoRefresh();
-
-     // Optional: Stop refresh if modal is open to prevent background changes
-     const observer = new MutationObserver(mutations => {
-         mutations.forEach(mutation => {
-             if (mutation.attributeName === 'class') {
-                 const isHidden = taskDetailModal.classList.contains('hidden');
-                 if (isHidden && !document.hidden) {
-                     startAutoRefresh(); // Restart if modal closed and page visible
-                 } else if (!isHidden) {
-                     stopAutoRefresh(); // Stop if modal opened
-                 }
-             }
-         });
-     });
-     observer.observe(taskDetailModal, { attributes: true });
+    socket.on('task_update', applyTaskDelta);
 
+    window.addEventListener('beforeunload', () => {
+        socket.emit('leave', { room: 'tasks' });
+    });
 
 }); // End DOMContentLoaded
\ No newline at end of file
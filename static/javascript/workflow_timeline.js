@@ -1,5 +1,8 @@
 document.addEventListener('DOMContentLoaded', function () {
     const taskId = document.body.dataset.taskId;
+    const workflowType = document.body.dataset.workflowType;
+    // ID of the last step event applied; the server replays only newer ones on (re)join
+    let lastEventId = document.body.dataset.lastEventId || null;
     const connectionStatus = document.getElementById('connection-status');
     const backButton = document.getElementById('back-to-tasks');
 
@@ -66,6 +69,53 @@ document.addEventListener('DOMContentLoaded', function () {
         }
     }
 
+    const stepDurations = {}; // step_id -> duration (ms) of this run
+    const stepLatency = {}; // step_id -> { p50_ms, p95_ms } over past runs of this workflow type
+
+    function formatDuration(ms) {
+        if (ms === null || ms === undefined) return '';
+        if (ms < 1000) return `${ms} ms`;
+        if (ms < 60000) return `${(ms / 1000).toFixed(1)} s`;
+        return `${Math.floor(ms / 60000)} m ${Math.round((ms % 60000) / 1000)} s`;
+    }
+
+    /**
+     * Shows the duration of a step in this run next to the typical (p50/p95) duration.
+     */
+    function renderStepTiming(stepId) {
+        const timingElement = document.querySelector(`.timeline-step[data-step-id="${stepId}"] .step-timing`);
+        if (!timingElement) return;
+        const parts = [];
+        if (stepDurations[stepId] !== undefined) parts.push(`Durasi: ${formatDuration(stepDurations[stepId])}`);
+        const latency = stepLatency[stepId];
+        if (latency && latency.p50_ms !== null) {
+            parts.push(`biasanya ${formatDuration(latency.p50_ms)} (p95 ${formatDuration(latency.p95_ms)})`);
+        }
+        timingElement.textContent = parts.join(' · ');
+    }
+
+    function setStepDuration(stepId, durationMs) {
+        if (durationMs === null || durationMs === undefined) return;
+        stepDurations[stepId] = durationMs;
+        renderStepTiming(stepId);
+    }
+
+    /**
+     * Loads the latency histograms of this workflow type to compare the run against.
+     */
+    function loadLatencyMetrics() {
+        if (!workflowType) return;
+        fetch(`/api/workflow/${encodeURIComponent(workflowType)}/metrics`)
+            .then(response => response.ok ? response.json() : null)
+            .then(metrics => {
+                if (!metrics) return;
+                metrics.steps.forEach(step => { stepLatency[step.step_id] = step; });
+                stepLatency.workflow_finish = metrics.total;
+                document.querySelectorAll('.timeline-step').forEach(el => renderStepTiming(el.dataset.stepId));
+            })
+            .catch(error => console.warn('Could not load workflow latency metrics:', error));
+    }
+
     /**
      * Loads the saved state from the server and applies it to the timeline.
      */
@@ -78,10 +128,16 @@ document.addEventListener('DOMContentLoaded', function () {
                 updateStepStatus(stepId, stepData.status, stepData.message);
             }
         }
+        if (typeof initialStepTimings !== 'undefined' && initialStepTimings) {
+            for (const stepId in initialStepTimings) {
+                setStepDuration(stepId, initialStepTimings[stepId]);
+            }
+        }
     }
 
     // --- APPLY THE SAVED STATE ON PAGE LOAD ---
     applyInitialState();
+    loadLatencyMetrics();
     
     // --- WebSocket Connection Setup ---
     const socket = io();
@@ -90,7 +146,7 @@ document.addEventListener('DOMContentLoaded', function () {
         console.log('Successfully connected to WebSocket server.');
         connectionStatus.innerHTML = `<p class="font-bold">Terhubung!</p><p>Mendengarkan pembaruan status real-time.</p>`;
         connectionStatus.className = 'mb-6 bg-green-100 border-l-4 border-green-500 text-green-700 p-4';
-        socket.emit('join', { room: taskId });
+        socket.emit('join', { room: taskId, last_event_id: lastEventId });
     });
 
     socket.on('disconnect', () => {
@@ -100,9 +156,30 @@ document.addEventListener('DOMContentLoaded', function () {
     });
 
     // --- REAL-TIME UPDATE HANDLER ---
-    socket.on('status_update', (data) => {
+    /**
+     * Compares two event log IDs ("<ms>-<seq>"). Returns true when a is newer than b.
+     */
+    function isNewerEvent(a, b) {
+        if (!b) return true;
+        const [aMs, aSeq] = a.split('-').map(Number);
+        const [bMs, bSeq] = b.split('-').map(Number);
+        return aMs > bMs || (aMs === bMs && aSeq > bSeq);
+    }
+
+    // Last event applied per step. A replayed event can also arrive live, and a
+    // replay frame can land after newer live events, so each step only moves forward.
+    const lastEventIdByStep = {};
+
+    function onStatusUpdate(data) {
+        if (data.event_id) {
+            if (!isNewerEvent(data.event_id, lastEventIdByStep[data.step_id])) return;
+            lastEventIdByStep[data.step_id] = data.event_id;
+            if (isNewerEvent(data.event_id, lastEventId)) lastEventId = data.event_id;
+        }
         console.log('Received real-time status update:', data);
         updateStepStatus(data.step_id, data.status, data.message);
+        setStepDuration(data.step_id, data.duration_ms);
+        setStepDuration('workflow_finish', data.total_ms);
 
         // Find the last step defined in the HTML to determine when the workflow is "finished"
         const allSteps = Array.from(document.querySelectorAll('.timeline-step:not([data-step-id="workflow_finish"])'));
@@ -113,6 +190,16 @@ document.addEventListener('DOMContentLoaded', function () {
         } else if (data.step_id === lastDefinedStepId && data.status === 'success') {
             updateStepStatus('workflow_finish', 'success', 'Semua langkah berhasil diselesaikan.');
         }
+    }
+
+    // Step updates arrive coalesced: one frame holding the latest update per step
+    socket.on('event_batch', (frame) => {
+        if (frame.replay) {
+            console.log(`Replaying ${frame.events.length} missed step event(s).`);
+        }
+        frame.events
+            .filter(({ event }) => event === 'status_update')
+            .forEach(({ data }) => onStatusUpdate(data));
     });
     
     window.addEventListener('beforeunload', () => {
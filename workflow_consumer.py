@@ -0,0 +1,29 @@
+# workflow_consumer.py
+import os
+import socket
+import time
+from app import create_app
+from blueprints.workflow.utils import ensure_step_event_group, consume_step_events
+
+# Dedicated worker that applies the n8n step callbacks queued by
+# /api/workflow/update. Several can run side by side; each needs its own name.
+app = create_app()
+
+
+def main():
+    consumer_name = os.getenv('WORKFLOW_CONSUMER_NAME', f"{socket.gethostname()}-{os.getpid()}")
+    with app.app_context():
+        if app.redis_conn is None:
+            raise SystemExit("Redis is not available; the workflow consumer cannot start.")
+        ensure_step_event_group(app.redis_conn)
+        print(f"Workflow event consumer '{consumer_name}' started.")
+        while True:
+            try:
+                consume_step_events(consumer_name)
+            except Exception as e:
+                print(f"ERROR in workflow event consumer: {e}")
+                time.sleep(1)
+
+
+if __name__ == '__main__':
+    main()